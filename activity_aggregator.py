@@ -0,0 +1,99 @@
+import heapq
+import threading
+from collections import Counter
+
+
+# 集計から除外するメッセージのsubtype
+EXCLUDED_SUBTYPES = ('bot_message', 'system')
+
+
+def empty_channel_stats():
+    return {
+        'posts': 0,
+        'replies': 0,
+        'threads': 0,
+        'unique_posters': 0,
+        'reactions': 0,
+        'total_activity': 0
+    }
+
+
+class ActivityAggregator:
+    """メッセージを1ページずつ受け取り、全ての集計を1回の走査で更新する
+
+    メッセージ本体は保持しないため、メモリ使用量は集計結果の大きさだけで決まる。
+    複数スレッドから同時にadd()してもよい。
+    """
+
+    def __init__(self, is_bot_user):
+        self.is_bot_user = is_bot_user
+        self.message_count = 0
+        self.post_counts = Counter()
+        self.reaction_given_counts = Counter()
+        self.reaction_received_counts = Counter()
+        self.lock = threading.Lock()
+
+    def _is_human_post(self, message):
+        if message.get('subtype') in EXCLUDED_SUBTYPES:
+            return False
+        user_id = message.get('user')
+        return bool(user_id) and not self.is_bot_user(user_id)
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        """1ページ分のメッセージを個人ランキングの集計に加える
+
+        チャンネル活動状況はchannel_activity.ChannelActivityで集計する。
+        """
+        # bot判定（ユーザー情報の参照）はロックの外で行う
+        human_posts = [self._is_human_post(message) for message in messages]
+
+        with self.lock:
+            self.message_count += len(messages)
+
+            for message, is_human_post in zip(messages, human_posts):
+                if is_human_post:
+                    self.post_counts[message['user']] += 1
+
+                if 'reactions' in message:
+                    # リアクションをした人
+                    for reaction in message['reactions']:
+                        for user_id in reaction['users']:
+                            self.reaction_given_counts[user_id] += 1
+                    # リアクションを受けた人（メッセージの投稿者）
+                    message_user = message.get('user')
+                    if message_user:
+                        self.reaction_received_counts[message_user] += sum(
+                            reaction['count'] for reaction in message['reactions']
+                        )
+
+    def to_state(self):
+        """集計結果をJSONで保存できる辞書にする（スナップショット用）"""
+        with self.lock:
+            return {
+                'message_count': self.message_count,
+                'posts': dict(self.post_counts),
+                'reactions_given': dict(self.reaction_given_counts),
+                'reactions_received': dict(self.reaction_received_counts),
+            }
+
+    def merge_state(self, state):
+        """to_state()の結果を集計に足し合わせる"""
+        with self.lock:
+            self.message_count += state['message_count']
+            self.post_counts.update(state['posts'])
+            self.reaction_given_counts.update(state['reactions_given'])
+            self.reaction_received_counts.update(state['reactions_received'])
+
+    def top(self, metric, n):
+        """上位n件を (ユーザーID, 件数) のリストで返す"""
+        counters = {
+            'posts': self.post_counts,
+            'reactions_given': self.reaction_given_counts,
+            'reactions_received': self.reaction_received_counts,
+        }
+        return top_n(counters[metric], n)
+
+
+def top_n(counter, n):
+    """件数の多い順に上位n件を返す（同数の場合はIDの順で並びを固定）"""
+    return heapq.nsmallest(n, counter.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,149 @@
+import threading
+from array import array
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:  # numpyがない環境では純Pythonで同じ集計を行う
+    np = None
+
+from activity_aggregator import EXCLUDED_SUBTYPES
+
+
+# subtypeのコード（0: 通常メッセージ、1以降: EXCLUDED_SUBTYPES、最後: その他）
+SUBTYPE_CODES = {subtype: i for i, subtype in enumerate(EXCLUDED_SUBTYPES, 1)}
+OTHER_SUBTYPE = len(SUBTYPE_CODES) + 1
+
+
+def as_array(values, dtype):
+    """array.arrayをコピーせずnumpy配列として参照する"""
+    return np.frombuffer(values, dtype=dtype)
+
+
+class ActivityColumns:
+    """メッセージを列指向の配列に展開し、ランキングをまとめて計算する集計エンジン
+
+    ユーザーIDは整数に置き換え（intern）、1メッセージあたり10バイト程度の
+    配列として保持する（ランキングに使わない時刻・チャンネルは保持しない）。ランキングはnumpyのbincount／argpartitionで計算するため、
+    月次・年次のような長期間の集計でも辞書の更新を繰り返さずに済む。
+    ActivityAggregatorと同じインターフェースを持つ。
+    """
+
+    def __init__(self, is_bot_user):
+        self.is_bot_user = is_bot_user
+        self.user_index = {}
+        self.users = []
+        # メッセージ単位の列
+        self.msg_user = array('i')
+        self.msg_subtype = array('b')
+        self.msg_reactions = array('i')
+        # リアクション単位の列（リアクションをしたユーザー）
+        self.reaction_user = array('i')
+        self.lock = threading.Lock()
+
+    @property
+    def message_count(self):
+        return len(self.msg_user)
+
+    def _intern(self, index, values, key):
+        position = index.get(key)
+        if position is None:
+            position = index[key] = len(values)
+            values.append(key)
+        return position
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        """1ページ分のメッセージを列に追加する"""
+        with self.lock:
+            for message in messages:
+                user_id = message.get('user')
+                user = self._intern(self.user_index, self.users, user_id) if user_id else -1
+                subtype = message.get('subtype')
+                reactions = message.get('reactions', ())
+
+                self.msg_user.append(user)
+                self.msg_subtype.append(0 if not subtype else SUBTYPE_CODES.get(subtype, OTHER_SUBTYPE))
+                self.msg_reactions.append(sum(reaction['count'] for reaction in reactions) if user_id else 0)
+                for reaction in reactions:
+                    for reaction_user_id in reaction['users']:
+                        self.reaction_user.append(self._intern(self.user_index, self.users, reaction_user_id))
+
+    def _bot_mask(self):
+        """ユーザーごとのbot判定（ユーザー単位で1回だけ判定する）"""
+        return [bool(self.is_bot_user(user_id)) for user_id in self.users]
+
+    def _human_post_mask(self, user, subtype, bots):
+        """bot・システムメッセージを除いた投稿かどうか"""
+        excluded = list(SUBTYPE_CODES.values())
+        if np is not None:
+            bot_array = np.array(bots + [True], dtype=bool)  # 末尾はuser=-1（投稿者なし）用
+            return (user >= 0) & ~np.isin(subtype, excluded) & ~bot_array[user]
+        return [u >= 0 and s not in excluded and not bots[u] for u, s in zip(user, subtype)]
+
+    def _columns(self):
+        if np is None:
+            return self.msg_user, self.msg_subtype
+        return as_array(self.msg_user, np.int32), as_array(self.msg_subtype, np.int8)
+
+    def totals(self, metric):
+        """ユーザーごとの合計を配列（またはリスト）で返す。添字はself.usersと対応する"""
+        with self.lock:
+            user, subtype = self._columns()
+            size = len(self.users)
+            if metric == 'posts':
+                human = self._human_post_mask(user, subtype, self._bot_mask())
+                if np is not None:
+                    return np.bincount(user[human], minlength=size)
+                totals = [0] * size
+                for u, is_human in zip(user, human):
+                    if is_human:
+                        totals[u] += 1
+                return totals
+            if metric == 'reactions_given':
+                if np is not None:
+                    return np.bincount(as_array(self.reaction_user, np.int32), minlength=size)
+                totals = [0] * size
+                for u in self.reaction_user:
+                    totals[u] += 1
+                return totals
+            if metric == 'reactions_received':
+                if np is not None:
+                    weights = as_array(self.msg_reactions, np.int32)
+                    has_user = user >= 0
+                    return np.bincount(user[has_user], weights=weights[has_user], minlength=size).astype(np.int64)
+                totals = [0] * size
+                for u, count in zip(user, self.msg_reactions):
+                    if u >= 0:
+                        totals[u] += count
+                return totals
+            raise ValueError(f"未対応の集計項目: {metric}")
+
+    def top(self, metric, n):
+        """上位n件を (ユーザーID, 件数) のリストで返す（同数の場合はIDの順）"""
+        totals = self.totals(metric)
+        if np is not None:
+            candidates = np.flatnonzero(totals)
+            if len(candidates) > n:
+                # 上位n件の境界値を求め、それ以上の値を持つユーザーだけを並べ替える
+                threshold = np.partition(totals[candidates], len(candidates) - n)[len(candidates) - n]
+                candidates = candidates[totals[candidates] >= threshold]
+            pairs = [(self.users[i], int(totals[i])) for i in candidates]
+        else:
+            pairs = [(self.users[i], count) for i, count in enumerate(totals) if count]
+        return sorted(pairs, key=lambda item: (-item[1], item[0]))[:n]
+
+    def counter(self, metric):
+        totals = self.totals(metric)
+        return Counter({self.users[i]: int(count) for i, count in enumerate(totals) if count})
+
+    @property
+    def post_counts(self):
+        return self.counter('posts')
+
+    @property
+    def reaction_given_counts(self):
+        return self.counter('reactions_given')
+
+    @property
+    def reaction_received_counts(self):
+        return self.counter('reactions_received')
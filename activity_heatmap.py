@@ -0,0 +1,181 @@
+import json
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # numpyがない環境では純Pythonで同じ集計を行う
+    np = None
+
+from activity_aggregator import EXCLUDED_SUBTYPES
+
+
+# JSTはUTC+9（夏時間なし）
+JST_OFFSET_SECONDS = 9 * 60 * 60
+HOURS_PER_DAY = 24
+DAYS_PER_WEEK = 7
+HOURS_PER_WEEK = HOURS_PER_DAY * DAYS_PER_WEEK
+# 1970-01-01（UNIX時刻0）は木曜日（月曜日を0とすると3）
+EPOCH_WEEKDAY = 3
+WEEKDAY_NAMES = ('月', '火', '水', '木', '金', '土', '日')
+
+
+def hour_of_week(ts):
+    """メッセージのtsをJSTの「曜日×時」の番号（月曜0時=0 ～ 日曜23時=167）に変換する"""
+    hours = int(float(ts) + JST_OFFSET_SECONDS) // 3600
+    return (hours // HOURS_PER_DAY + EPOCH_WEEKDAY) % DAYS_PER_WEEK * HOURS_PER_DAY + hours % HOURS_PER_DAY
+
+
+def bin_hours_of_week(ts_values):
+    """tsのリストを曜日×時の168区間に振り分け、区間ごとの件数を返す（numpyがあればまとめて計算）"""
+    if np is not None:
+        hours = (np.asarray(ts_values, dtype=np.float64) + JST_OFFSET_SECONDS) // 3600
+        slots = ((hours // HOURS_PER_DAY + EPOCH_WEEKDAY) % DAYS_PER_WEEK * HOURS_PER_DAY
+                 + hours % HOURS_PER_DAY).astype(np.int64)
+        return np.bincount(slots, minlength=HOURS_PER_WEEK)
+    counts = [0] * HOURS_PER_WEEK
+    for ts in ts_values:
+        counts[hour_of_week(ts)] += 1
+    return counts
+
+
+def slot_label(slot):
+    """曜日×時の番号を「月曜 21時台」の形式にする"""
+    return f"{WEEKDAY_NAMES[slot // HOURS_PER_DAY]}曜 {slot % HOURS_PER_DAY}時台"
+
+
+class ActivityHeatmap:
+    """投稿の時刻をJSTの曜日×時（7×24）の区間に集計する
+
+    ActivityAggregatorと同じadd()で受け取るため、同じ走査の中で一緒に更新できる。
+    ワークスペース全体とチャンネルごとのヒートマップを持つ。
+    """
+
+    def __init__(self, is_bot_user):
+        self.is_bot_user = is_bot_user
+        self.total = self._empty()
+        self.channel_counts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _empty():
+        return np.zeros(HOURS_PER_WEEK, dtype=np.int64) if np is not None else [0] * HOURS_PER_WEEK
+
+    @staticmethod
+    def _accumulate(counts, binned):
+        if np is not None:
+            counts += binned
+            return
+        for slot, count in enumerate(binned):
+            counts[slot] += count
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        """1ページ分のメッセージのうち、人の投稿（スレッド返信を含む）の時刻を集計に加える"""
+        # bot判定（ユーザー情報の参照）はロックの外で行う
+        ts_values = [
+            float(message['ts']) for message in messages
+            if message.get('subtype') not in EXCLUDED_SUBTYPES
+            and message.get('user') and not self.is_bot_user(message['user'])
+        ]
+        if not ts_values:
+            return
+        binned = bin_hours_of_week(ts_values)
+        with self.lock:
+            self._accumulate(self.total, binned)
+            if channel_id not in self.channel_counts:
+                self.channel_counts[channel_id] = self._empty()
+            self._accumulate(self.channel_counts[channel_id], binned)
+
+    def to_state(self):
+        """ヒートマップをJSONで保存できる辞書にする（スナップショット用）"""
+        with self.lock:
+            return {
+                'total': [int(count) for count in self.total],
+                'channels': {
+                    channel_id: [int(count) for count in counts] for channel_id, counts in self.channel_counts.items()
+                },
+            }
+
+    def merge_state(self, state):
+        """to_state()の結果を足し合わせる"""
+        with self.lock:
+            self._accumulate(self.total, state['total'])
+            for channel_id, counts in state['channels'].items():
+                if channel_id not in self.channel_counts:
+                    self.channel_counts[channel_id] = self._empty()
+                self._accumulate(self.channel_counts[channel_id], counts)
+
+    def counts(self, channel_id=None):
+        """168区間の件数をリストで返す（channel_id省略時はワークスペース全体）"""
+        if channel_id is None:
+            counts = self.total
+        else:
+            counts = self.channel_counts.get(channel_id)
+            if counts is None:
+                return [0] * HOURS_PER_WEEK
+        return [int(count) for count in counts]
+
+    def matrix(self, channel_id=None):
+        """7×24（曜日×時）の件数を返す（月曜日が先頭）"""
+        counts = self.counts(channel_id)
+        return [counts[day * HOURS_PER_DAY:(day + 1) * HOURS_PER_DAY] for day in range(DAYS_PER_WEEK)]
+
+    def peaks(self, n, channel_id=None):
+        """件数の多い区間を (区間の番号, 件数) のリストで返す（件数0の区間は除く）"""
+        counts = self.counts(channel_id)
+        ranked = sorted((slot for slot in range(HOURS_PER_WEEK) if counts[slot]), key=lambda slot: -counts[slot])
+        return [(slot, counts[slot]) for slot in ranked[:n]]
+
+    def weekday_totals(self, channel_id=None):
+        return [sum(row) for row in self.matrix(channel_id)]
+
+    def hour_totals(self, channel_id=None):
+        return [sum(column) for column in zip(*self.matrix(channel_id))]
+
+    def summary_section(self, channels, n=3):
+        """レポートに載せる時間帯のまとめ（全体のピークと、チャンネルごとの最も多い時間帯）"""
+        peaks = self.peaks(n)
+        if not peaks:
+            return None
+        weekday_totals = self.weekday_totals()
+        hour_totals = self.hour_totals()
+        busiest_day = max(range(DAYS_PER_WEEK), key=lambda day: weekday_totals[day])
+        busiest_hour = max(range(HOURS_PER_DAY), key=lambda hour: hour_totals[hour])
+
+        section = "■ 活動が多い時間帯（JST）"
+        section += "\n　" + "、".join(f"{slot_label(slot)}（{count}件）" for slot, count in peaks)
+        section += f"\n　曜日では{WEEKDAY_NAMES[busiest_day]}曜、時間では{busiest_hour}時台がいちばん盛り上がってるぞ"
+        for channel in channels:
+            channel_peaks = self.peaks(1, channel['id'])
+            if channel_peaks:
+                slot, count = channel_peaks[0]
+                section += f"\n　#{channel['name']}：{slot_label(slot)}（{count}件）"
+        return section
+
+    def to_dict(self, channels):
+        """ヒートマップをファイル保存用の辞書にする（チャンネルはチャンネル名で出力）"""
+        def describe(channel_id):
+            return {
+                'matrix': self.matrix(channel_id),
+                'peaks': [
+                    {'weekday': WEEKDAY_NAMES[slot // HOURS_PER_DAY], 'hour': slot % HOURS_PER_DAY, 'count': count}
+                    for slot, count in self.peaks(5, channel_id)
+                ],
+            }
+
+        return {
+            'timezone': 'Asia/Tokyo',
+            'weekdays': list(WEEKDAY_NAMES),
+            'workspace': describe(None),
+            'channels': {
+                channel['name']: describe(channel['id'])
+                for channel in channels if channel['id'] in self.channel_counts
+            },
+        }
+
+    def save(self, path, channels):
+        """ヒートマップをJSONで保存"""
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(channels), f, ensure_ascii=False)
+        except OSError as e:
+            print(f"ヒートマップの保存エラー: {e}")
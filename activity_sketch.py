@@ -0,0 +1,299 @@
+import base64
+import hashlib
+import heapq
+import math
+import random
+import threading
+import zlib
+
+from activity_aggregator import EXCLUDED_SUBTYPES, top_n
+
+
+# HyperLogLogのレジスタ数は2のDEFAULT_PRECISION乗（4096個で4KB、人数の誤差は±1.6%程度）
+DEFAULT_PRECISION = 12
+# ランキング用に件数を数えるユーザー数の上限（これ以下の人数なら件数は正確）
+DEFAULT_CAPACITY = 1000
+# 無作為に選んで残す投稿の数と、残す本文の長さ
+DEFAULT_SAMPLE_SIZE = 3
+SAMPLE_TEXT_LENGTH = 60
+
+
+def hash64(value):
+    """64ビットのハッシュ値（Pythonのhash()と違い、プロセスが変わっても同じ値になる）"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """異なり数（何人いたか）を固定サイズのレジスタで推定する
+
+    標準誤差は1.04 / sqrt(2 ** precision)。レジスタごとの最大値をとれば足し合わせられる。
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, value):
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"精度の異なるHyperLogLogは足し合わせられません: {self.precision} / {other.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        # 少ないうちは空のレジスタの数から求める（linear counting）
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    def __len__(self):
+        return round(self.estimate())
+
+    def to_state(self):
+        """JSONで保存できる辞書にする（レジスタは圧縮してBase64にする）"""
+        return {
+            'precision': self.precision,
+            'registers': base64.b64encode(zlib.compress(bytes(self.registers))).decode('ascii'),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['precision'])
+        sketch.registers = bytearray(zlib.decompress(base64.b64decode(state['registers'])))
+        return sketch
+
+
+class FrequentItems:
+    """件数の多いキーだけを数える（Misra-Gries。Space-Savingと同じく足し合わせられる要約）
+
+    キーがcapacityの2倍を超えたら、capacity+1番目の件数を全てのキーから引いて少ないキーを捨てる。
+    残ったキーの件数は実際より最大errorだけ少なく、errorはtotal / (capacity + 1)を超えない。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        self.error = 0
+
+    def add(self, key, count=1):
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.total += count
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def _prune(self):
+        if len(self.counts) <= self.capacity:
+            return
+        threshold = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.error += threshold
+        self.counts = {key: count - threshold for key, count in self.counts.items() if count > threshold}
+
+    def merge(self, counts, total, error):
+        for key, count in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.total += total
+        self.error += error
+        self._prune()
+
+    def to_state(self):
+        return {'counts': dict(self.counts), 'total': self.total, 'error': self.error}
+
+
+class Reservoir:
+    """受け取った中から無作為にsize件を残す（リザーバーサンプリング）"""
+
+    def __init__(self, size=DEFAULT_SAMPLE_SIZE):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self.random = random.Random()
+
+    def add(self, item):
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+            return
+        position = self.random.randrange(self.seen)
+        if position < self.size:
+            self.items[position] = item
+
+    def merge(self, items, seen):
+        """別のリザーバーの結果と合わせ、両方を通して無作為に選んだのと同じ分布でsize件を残す"""
+        mine, theirs = list(self.items), list(items)
+        self.random.shuffle(mine)
+        self.random.shuffle(theirs)
+        mine_seen, their_seen = self.seen, seen
+        merged = []
+        while len(merged) < self.size and (mine or theirs):
+            if mine and (not theirs or self.random.randrange(mine_seen + their_seen) < mine_seen):
+                merged.append(mine.pop())
+                mine_seen -= 1
+            else:
+                merged.append(theirs.pop())
+                their_seen -= 1
+        self.items = merged
+        self.seen += seen
+
+
+class ActivitySketch:
+    """個人ランキングを固定サイズの要約（スケッチ）で近似集計する集計エンジン
+
+    ユーザー数・メッセージ数が増えてもメモリ使用量は一定で、誤差の上限を示せる。
+      投稿した人・リアクションした人の人数 … HyperLogLog（±relative_error程度）
+      投稿数・リアクション数のランキング … FrequentItems（件数は最大errorだけ少ない）
+      ピックアップ投稿 … Reservoir（sample_channel_idsのチャンネルの人の投稿から無作為に選ぶ）
+    to_state()／merge_state()でチャンネル・日ごとの集計を足し合わせられる。
+    ActivityAggregatorと同じインターフェースを持つ。
+    ピックアップ投稿は本文をレポートとスナップショットに残すため、sample_channel_ids
+    （レポートに載せてよい公開チャンネル）の投稿だけから選ぶ。省略したら選ばない。
+    """
+
+    def __init__(self, is_bot_user, precision=DEFAULT_PRECISION, capacity=DEFAULT_CAPACITY,
+                 sample_size=DEFAULT_SAMPLE_SIZE, sample_channel_ids=()):
+        self.is_bot_user = is_bot_user
+        self.sample_channel_ids = frozenset(sample_channel_ids)
+        self.message_count = 0
+        self.posters = HyperLogLog(precision)
+        self.reactors = HyperLogLog(precision)
+        self.counts = {
+            'posts': FrequentItems(capacity),
+            'reactions_given': FrequentItems(capacity),
+            'reactions_received': FrequentItems(capacity),
+        }
+        self.samples = Reservoir(sample_size)
+        # ピックアップ投稿の候補になった投稿数のチャンネル別の内訳（足し合わせるときに対象外のチャンネルを除くため）
+        self.sample_seen = {}
+        self.lock = threading.Lock()
+
+    def _is_human_post(self, message):
+        if message.get('subtype') in EXCLUDED_SUBTYPES:
+            return False
+        user_id = message.get('user')
+        return bool(user_id) and not self.is_bot_user(user_id)
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        """1ページ分のメッセージを要約に加える"""
+        # bot判定（ユーザー情報の参照）はロックの外で行う
+        human_posts = [self._is_human_post(message) for message in messages]
+        sampled = channel_id in self.sample_channel_ids
+
+        with self.lock:
+            self.message_count += len(messages)
+
+            for message, is_human_post in zip(messages, human_posts):
+                if is_human_post:
+                    self.counts['posts'].add(message['user'])
+                    self.posters.add(message['user'])
+                    if sampled:
+                        self.sample_seen[channel_id] = self.sample_seen.get(channel_id, 0) + 1
+                        self.samples.add({
+                            'channel': channel_id,
+                            'user': message['user'],
+                            'ts': message['ts'],
+                            'text': message.get('text', '')[:SAMPLE_TEXT_LENGTH],
+                        })
+
+                if 'reactions' in message:
+                    for reaction in message['reactions']:
+                        for user_id in reaction['users']:
+                            self.counts['reactions_given'].add(user_id)
+                            self.reactors.add(user_id)
+                    message_user = message.get('user')
+                    if message_user:
+                        self.counts['reactions_received'].add(
+                            message_user, sum(reaction['count'] for reaction in message['reactions'])
+                        )
+
+    def to_state(self):
+        """要約をJSONで保存できる辞書にする（スナップショット用）"""
+        with self.lock:
+            return {
+                'message_count': self.message_count,
+                'posters': self.posters.to_state(),
+                'reactors': self.reactors.to_state(),
+                'counts': {metric: items.to_state() for metric, items in self.counts.items()},
+                'samples': {
+                    'items': list(self.samples.items),
+                    'seen': self.samples.seen,
+                    'channels': dict(self.sample_seen),
+                },
+            }
+
+    def merge_state(self, state):
+        """to_state()の結果を足し合わせる"""
+        with self.lock:
+            self.message_count += state['message_count']
+            self.posters.merge(HyperLogLog.from_state(state['posters']))
+            self.reactors.merge(HyperLogLog.from_state(state['reactors']))
+            for metric, saved in state['counts'].items():
+                self.counts[metric].merge(saved['counts'], saved['total'], saved['error'])
+            # 以前のスナップショットに残っている、対象外のチャンネルのピックアップ投稿は使わない
+            saved = state['samples']
+            items = [item for item in saved['items'] if item['channel'] in self.sample_channel_ids]
+            if 'channels' in saved:
+                channel_seen = {
+                    channel_id: seen for channel_id, seen in saved['channels'].items()
+                    if channel_id in self.sample_channel_ids
+                }
+            else:
+                # チャンネル別の内訳がない以前の形式は、残した投稿の割合で候補数を減らし、残した投稿のチャンネルに割り振る
+                seen = round(saved['seen'] * len(items) / len(saved['items'])) if saved['items'] else 0
+                channel_seen = {}
+                for i, item in enumerate(items):
+                    share = seen // len(items) + (1 if i < seen % len(items) else 0)
+                    channel_seen[item['channel']] = channel_seen.get(item['channel'], 0) + share
+            for channel_id, seen in channel_seen.items():
+                self.sample_seen[channel_id] = self.sample_seen.get(channel_id, 0) + seen
+            self.samples.merge(items, sum(channel_seen.values()))
+
+    def top(self, metric, n):
+        """上位n件を (ユーザーID, 件数) のリストで返す（件数は最大error_bound(metric)だけ少ない）"""
+        return top_n(self.counts[metric].counts, n)
+
+    def error_bound(self, metric):
+        return self.counts[metric].error
+
+    @property
+    def post_counts(self):
+        return self.counts['posts'].counts
+
+    @property
+    def reaction_given_counts(self):
+        return self.counts['reactions_given'].counts
+
+    @property
+    def reaction_received_counts(self):
+        return self.counts['reactions_received'].counts
+
+    def summary_section(self):
+        """近似集計の人数・誤差とピックアップ投稿のセクションを生成"""
+        section = "■ 近似集計（大規模ワークスペース向け）"
+        section += (f"\n　投稿した人：約{len(self.posters)}人、リアクションした人：約{len(self.reactors)}人"
+                    f"（誤差±{self.posters.relative_error * 100:.1f}%程度。チャンネルの参加人数も同じ）")
+        errors = [self.error_bound(metric) for metric in self.counts]
+        if any(errors):
+            section += f"\n　ランキングの件数は実際より最大{max(errors)}件少ない可能性があるぞ"
+        else:
+            section += "\n　ランキングの件数は正確だぞ"
+        if self.samples.items:
+            section += f"\n　ピックアップ投稿（公開の集計対象チャンネルの{self.samples.seen}件から無作為に）"
+            for sample in self.samples.items:
+                text = ' '.join(sample['text'].split())
+                channel = f"<#{sample['channel']}> " if sample['channel'] else ''
+                section += f"\n　　{channel}<@{sample['user']}>：{text}"
+        return section
@@ -0,0 +1,207 @@
+"""複数のワークスペース・レポートをまとめて作成するバッチ実行
+
+設定ファイル（JSON）に書いたワークスペースごとにプロセスを分けて run.py を並列に実行する。
+各プロセスはそれぞれのトークンでクライアント・レートリミッター・キャッシュを持ち、
+レポートはワークスペースごとのファイルに保存する。全体の所要時間は最も遅いワークスペース程度になる。
+
+    python batch_run.py --config batch_config.json
+    python batch_run.py --config batch_config.json --workspace aircle --output-dir reports
+
+設定ファイルの例は batch_config.example.json を参照。
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+# レポート定義を省略したときに作成するレポート
+DEFAULT_REPORTS = [{'name': 'weekly', 'args': []}]
+
+
+def load_config(path):
+    """設定ファイルを読み込む"""
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    if not config.get('workspaces'):
+        raise ValueError(f"{path} に workspaces が設定されていません")
+    return config
+
+
+def build_jobs(config, output_dir, only=None):
+    """設定からワークスペースごとの実行内容を組み立てる
+
+    同じワークスペースのレポートは1つのプロセスで順に作成し、
+    2つ目以降のレポートは1つ目で取得したキャッシュ（メッセージ・ユーザー情報）を再利用する。
+    """
+    defaults = config.get('defaults', {})
+    cache_dir = config.get('cache_dir', '.slack-cache')
+    jobs = []
+    for workspace in config['workspaces']:
+        name = workspace['name']
+        if only and name not in only:
+            continue
+        workspace_dir = os.path.join(output_dir, name)
+        workspace_cache = os.path.join(cache_dir, name)
+        token_env = workspace.get('token_env', 'SLACK_BOT_TOKEN')
+
+        env = {
+            'MESSAGE_STORE_PATH': os.path.join(workspace_cache, 'messages.db'),
+            'USER_CACHE_PATH': os.path.join(workspace_cache, 'users.json'),
+            'ROLLUP_PATH': os.path.join(workspace_cache, 'rollups.db'),
+            'TERM_INDEX_PATH': os.path.join(workspace_cache, 'terms.db'),
+            'CHANNEL_CACHE_PATH': os.path.join(workspace_cache, 'channels.json'),
+            'METRICS_PATH': os.path.join(workspace_dir, 'metrics.json'),
+            'HEATMAP_PATH': os.path.join(workspace_dir, 'weekly_report_heatmap.json'),
+            'REACTION_GRAPH_PATH': os.path.join(workspace_dir, 'weekly_report_reactions.json'),
+        }
+        env.update(defaults.get('env', {}))
+        env.update(workspace.get('env', {}))
+        if workspace.get('target_channels'):
+            env['TARGET_CHANNELS'] = ','.join(workspace['target_channels'])
+        env = {key: str(value) for key, value in env.items()}
+
+        reports = []
+        for report in workspace.get('reports') or defaults.get('reports') or DEFAULT_REPORTS:
+            reports.append({
+                'name': report['name'],
+                'args': [str(arg) for arg in report.get('args', [])],
+                'path': os.path.join(workspace_dir, f"{report['name']}.txt"),
+            })
+
+        jobs.append({
+            'name': name,
+            'token_env': token_env,
+            'env': env,
+            'output_dir': workspace_dir,
+            'log_path': os.path.join(workspace_dir, 'run.log'),
+            'reports': reports,
+        })
+    return jobs
+
+
+def run_workspace(job, token):
+    """1つのワークスペースのレポートを順に作成する（ワーカープロセスで実行）
+
+    run.py は読み込み時に環境変数からクライアントやキャッシュを作るため、
+    環境変数を設定してからこのプロセスで初めて読み込む（ワーカープロセスは1つのワークスペースごとに
+    作り直すので、前のワークスペースのrun.pyが残ることはない）。進捗表示はワークスペースごとのログに書く。
+    """
+    os.environ.update(job['env'])
+    os.environ['SLACK_BOT_TOKEN'] = token
+    os.makedirs(job['output_dir'], exist_ok=True)
+
+    started = time.perf_counter()
+    result = {'workspace': job['name'], 'log': job['log_path'], 'reports': [], 'error': None}
+    with open(job['log_path'], 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            import run
+        except Exception as e:
+            print(f"初期化エラー: {e}")
+            result['error'] = str(e)
+            return result
+
+        try:
+            for report in job['reports']:
+                print(f"=== レポート作成: {report['name']} ===")
+                run.REPORT_PATH = report['path']
+                report_started = time.perf_counter()
+                try:
+                    run.main(report['args'])
+                    error = None
+                except (Exception, SystemExit) as e:
+                    print(f"レポート作成エラー: {e}")
+                    error = str(e)
+                result['reports'].append({
+                    'name': report['name'],
+                    'path': report['path'],
+                    'seconds': round(time.perf_counter() - report_started, 3),
+                    'error': error,
+                })
+        finally:
+            if run.METRICS_PATH:
+                run.telemetry.write(run.METRICS_PATH, run.METRICS_FORMAT)
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def is_success(result):
+    return not result['error'] and all(not report['error'] for report in result['reports'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="複数のワークスペースのレポートを並列に作成する")
+    parser.add_argument('--config', required=True, help="設定ファイル（JSON）")
+    parser.add_argument('--output-dir', default='reports', help="レポートの保存先（ワークスペースごとにサブディレクトリを作成）")
+    parser.add_argument('--workspace', action='append', help="指定したワークスペースだけ実行（複数指定可）")
+    parser.add_argument('--workers', type=int, help="同時に実行するワークスペース数（省略時は全ワークスペース）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        print(f"設定ファイル読み込みエラー: {e}")
+        return 1
+
+    jobs = build_jobs(config, args.output_dir, args.workspace)
+    if not jobs:
+        print("実行するワークスペースがありません")
+        return 1
+
+    results = []
+    runnable = []
+    for job in jobs:
+        token = os.getenv(job['token_env'])
+        if token:
+            runnable.append((job, token))
+        else:
+            print(f"[{job['name']}] エラー: 環境変数 {job['token_env']} が設定されていません")
+            results.append({'workspace': job['name'], 'log': None, 'reports': [],
+                            'error': f"{job['token_env']} が設定されていません"})
+
+    started = time.perf_counter()
+    if runnable:
+        workers = max(1, min(args.workers or len(runnable), len(runnable)))
+        print(f"{len(runnable)}件のワークスペースを{workers}プロセスで実行します")
+        # run.pyはワークスペースごとに新しいプロセスで読み込む必要があるため、forkではなくspawnで起動し、
+        # ワーカープロセスは1ワークスペースごとに作り直す（使い回すと前のワークスペースのトークン・設定が残る）
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), max_tasks_per_child=1
+        ) as executor:
+            futures = {executor.submit(run_workspace, job, token): job for job, token in runnable}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'workspace': job['name'], 'log': job['log_path'], 'reports': [], 'error': str(e)}
+                status = '完了' if is_success(result) else 'エラーあり'
+                print(f"[{job['name']}] {status}（{result.get('seconds', 0)}秒、ログ: {result['log']}）")
+                for report in result['reports']:
+                    print(f"  {report['name']}: {report['path']}" + (f" → エラー: {report['error']}" if report['error'] else ""))
+                results.append(result)
+
+    summary = {
+        'seconds': round(time.perf_counter() - started, 3),
+        'workspaces': sorted(results, key=lambda result: result['workspace']),
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    summary_path = os.path.join(args.output_dir, 'batch_summary.json')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"実行結果を保存: {summary_path}（全体 {summary['seconds']}秒）")
+
+    return 0 if all(is_success(result) for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""run.py のベンチマーク
+
+合成ワークスペース（bench/fake_slack.py）に対して run.main() を実行し、
+全体と各ステージ（チャンネル一覧・履歴取得・ユーザー情報・集計・レポート）の時間、
+APIメソッドごとの呼び出し回数をJSONで出力する。
+ステージの時間は run.telemetry が記録したもの（集計は全ての集計をまとめた時間）をそのまま使う。
+ステージは入れ子になることがある（履歴取得の時間には、取得しながら行う集計の時間も含まれる）。
+
+    python -m bench.benchmark --channels 200 --users 1000 --messages-per-day 30
+    python -m bench.benchmark --workers 1 --output bench_output.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+from bench.fake_slack import FakeSlackClient, WorkspaceSpec
+
+
+def stage_summary(telemetry):
+    """run.telemetry が記録したステージごとの時間（複数スレッドで実行されるステージは合計時間）"""
+    return {
+        stage: {'seconds': round(stats['seconds'], 6), 'count': stats['count']}
+        for stage, stats in sorted(telemetry.summary()['stages'].items())
+    }
+
+
+def install(run, fake_client, args):
+    """run モジュールのクライアントと保存先を計測用に差し替える（関数は差し替えない）"""
+    from channel_catalog import ChannelCatalog
+    from slack_rate_limit import TIER_LIMITS, RateLimitedClient, RateLimiter
+    from user_directory import UserDirectory
+
+    tier_limits = {tier: limit * args.rate_scale for tier, limit in TIER_LIMITS.items()}
+    run.client = RateLimitedClient(fake_client, RateLimiter(tier_limits=tier_limits, telemetry=run.telemetry))
+    run.user_directory = UserDirectory(run.client)
+    run.channel_catalog = ChannelCatalog(run.client)
+    run.message_store = run.open_message_store(args.message_store)
+    run.rollup_store = run.open_rollup_store(args.rollups)
+    run.FETCH_WORKERS = args.workers
+    run.ANALYTICS_ENGINE = args.engine
+    run.INCLUDE_THREAD_REPLIES = args.thread_replies
+
+
+def run_once(args, spec):
+    """1回分のベンチマークを実行し、結果を辞書で返す"""
+    # run.py は読み込み時にクライアントを作るため、毎回読み込み直して状態を初期化する
+    sys.modules.pop('run', None)
+    import run
+
+    fake_client = FakeSlackClient(spec)
+    install(run, fake_client, args)
+
+    argv = ['--days', str(spec.days)]
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            # 進捗表示は計測の邪魔になるため捨てる
+            with open(os.devnull, 'w') as devnull:
+                stdout = sys.stdout
+                sys.stdout = devnull
+                started = time.perf_counter()
+                try:
+                    run.main(argv)
+                finally:
+                    wall = time.perf_counter() - started
+                    sys.stdout = stdout
+            with open('weekly_report.txt', encoding='utf-8') as f:
+                report_chars = len(f.read())
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'wall_seconds': round(wall, 6),
+        'stages': stage_summary(run.telemetry),
+        'api_calls': dict(sorted(fake_client.calls.items())),
+        'api_calls_total': sum(fake_client.calls.values()),
+        'rate_limited': fake_client.rate_limited,
+        'report_chars': report_chars,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="合成ワークスペースで run.py の性能を測定する")
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--messages-per-day', type=float, default=20.0, help="1チャンネル1日あたりのメッセージ数")
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--reaction-density', type=float, default=0.3, help="リアクションが付くメッセージの割合")
+    parser.add_argument('--thread-ratio', type=float, default=0.1, help="返信の付くメッセージの割合")
+    parser.add_argument('--dormant-ratio', type=float, default=0.3, help="投稿のないチャンネルの割合")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="API呼び出し1回あたりの疑似レイテンシ")
+    parser.add_argument('--rate-limit-every', type=int, default=0, help="N回に1回429を返す（0なら返さない）")
+    parser.add_argument('--retry-after', type=float, default=0.05, help="429のRetry-After（秒）")
+    parser.add_argument('--rate-scale', type=float, default=1000.0,
+                        help="Slackのレート制限ティアを何倍に緩めるか（1で本番と同じ）")
+    parser.add_argument('--workers', type=int, default=4, help="run.FETCH_WORKERS")
+    parser.add_argument('--engine', choices=['stream', 'columnar', 'sketch'], default='stream',
+                        help="run.ANALYTICS_ENGINE")
+    parser.add_argument('--thread-replies', action='store_true', help="run.INCLUDE_THREAD_REPLIES")
+    parser.add_argument('--message-store', help="run.MESSAGE_STORE_PATH（指定時は差分同期を計測）")
+    parser.add_argument('--rollups', help="run.ROLLUP_PATH")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="結果のJSONを書き出すファイル（省略時は標準出力）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    spec = WorkspaceSpec(
+        channels=args.channels,
+        users=args.users,
+        messages_per_day=args.messages_per_day,
+        days=args.days,
+        reaction_density=args.reaction_density,
+        thread_ratio=args.thread_ratio,
+        dormant_ratio=args.dormant_ratio,
+        latency=args.latency_ms / 1000,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    runs = [run_once(args, spec) for _ in range(args.repeat)]
+    walls = sorted(result['wall_seconds'] for result in runs)
+    result = {
+        'workspace': asdict(spec),
+        'settings': {
+            'workers': args.workers,
+            'engine': args.engine,
+            'thread_replies': args.thread_replies,
+            'rate_scale': args.rate_scale,
+            'message_store': bool(args.message_store),
+        },
+        'wall_seconds_median': walls[len(walls) // 2],
+        'runs': runs,
+    }
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
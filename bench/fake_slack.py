@@ -0,0 +1,194 @@
+"""ベンチマーク用のSlack Web API代替クライアント
+
+実際のワークスペースを使わずに run.py の性能を測るため、指定した規模の
+ワークスペース（チャンネル・ユーザー・メッセージ・リアクション）を合成し、
+WebClientと同じメソッド名・レスポンス形式で返す。429（レート制限）も再現できる。
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import SlackResponse
+
+
+@dataclass
+class WorkspaceSpec:
+    """合成するワークスペースの規模"""
+    channels: int = 50
+    users: int = 200
+    bot_ratio: float = 0.05
+    messages_per_day: float = 20.0
+    days: int = 7
+    reaction_density: float = 0.3
+    thread_ratio: float = 0.1
+    dormant_ratio: float = 0.3
+    # API呼び出し1回あたりの疑似レイテンシ（秒）
+    latency: float = 0.0
+    # N回に1回429を返す（0なら返さない）
+    rate_limit_every: int = 0
+    retry_after: float = 0.05
+    seed: int = 0
+
+
+class FakeSlackClient:
+    """合成ワークスペースを返すWebClientの代替（スレッドセーフ）"""
+
+    def __init__(self, spec=None, now=None):
+        self.spec = spec or WorkspaceSpec()
+        self.now = now or time.time()
+        self.calls = {}
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+        rnd = random.Random(self.spec.seed)
+
+        self.users = [
+            {
+                'id': f'U{i:06d}',
+                'name': f'user{i}',
+                'real_name': f'User {i}',
+                'is_bot': rnd.random() < self.spec.bot_ratio,
+                'profile': {'display_name': f'user{i}'},
+            }
+            for i in range(self.spec.users)
+        ]
+        self.channels = [
+            {
+                'id': f'C{i:06d}',
+                'name': f'channel-{i}',
+                'is_private': rnd.random() < 0.2,
+                'is_archived': False,
+            }
+            for i in range(self.spec.channels)
+        ]
+        self.dormant = {channel['id'] for channel in self.channels if rnd.random() < self.spec.dormant_ratio}
+        self._history = {}
+
+    def _record(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            count = sum(self.calls.values())
+            limited = self.spec.rate_limit_every and count % self.spec.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+        if self.spec.latency:
+            time.sleep(self.spec.latency)
+        if limited:
+            response = SlackResponse(
+                client=self, http_verb='POST', api_url=f'https://slack.com/api/{method}', req_args={},
+                data={'ok': False, 'error': 'ratelimited'},
+                headers={'Retry-After': str(self.spec.retry_after)}, status_code=429
+            )
+            raise SlackApiError('ratelimited', response)
+
+    def _channel_history(self, channel_id):
+        """チャンネルのメッセージを新しい順で返す（初回アクセス時に生成）"""
+        with self.lock:
+            if channel_id in self._history:
+                return self._history[channel_id]
+        rnd = random.Random(f'{self.spec.seed}:{channel_id}')
+        messages = []
+        if channel_id not in self.dormant:
+            count = int(self.spec.messages_per_day * self.spec.days)
+            for _ in range(count):
+                ts = self.now - rnd.random() * self.spec.days * 86400
+                user = rnd.choice(self.users)
+                message = {'type': 'message', 'user': user['id'], 'ts': f'{ts:.6f}', 'text': 'hello'}
+                if user['is_bot']:
+                    message['subtype'] = 'bot_message'
+                if rnd.random() < self.spec.reaction_density:
+                    reactors = rnd.sample(self.users, min(len(self.users), rnd.randint(1, 5)))
+                    message['reactions'] = [{
+                        'name': 'thumbsup',
+                        'users': [reactor['id'] for reactor in reactors],
+                        'count': len(reactors),
+                    }]
+                if rnd.random() < self.spec.thread_ratio:
+                    replies = rnd.randint(1, 5)
+                    message['thread_ts'] = message['ts']
+                    message['reply_count'] = replies
+                    message['latest_reply'] = f'{ts + replies:.6f}'
+                messages.append(message)
+            messages.sort(key=lambda m: float(m['ts']), reverse=True)
+        with self.lock:
+            self._history[channel_id] = messages
+        return messages
+
+    @staticmethod
+    def _page(items, cursor, limit):
+        start = int(cursor or 0)
+        end = start + min(limit or 100, 1000)
+        next_cursor = str(end) if end < len(items) else ''
+        return items[start:end], next_cursor
+
+    def users_list(self, cursor=None, limit=None, **kwargs):
+        self._record('users.list')
+        members, next_cursor = self._page(self.users, cursor, limit)
+        return {'ok': True, 'members': members, 'response_metadata': {'next_cursor': next_cursor}}
+
+    def users_info(self, user, **kwargs):
+        self._record('users.info')
+        for member in self.users:
+            if member['id'] == user:
+                return {'ok': True, 'user': member}
+        return {'ok': False, 'error': 'user_not_found'}
+
+    def conversations_list(self, types='public_channel', cursor=None, limit=None, **kwargs):
+        self._record('conversations.list')
+        wanted = types.split(',')
+        channels = [
+            channel for channel in self.channels
+            if ('private_channel' if channel['is_private'] else 'public_channel') in wanted
+        ]
+        page, next_cursor = self._page(channels, cursor, limit)
+        return {'ok': True, 'channels': page, 'response_metadata': {'next_cursor': next_cursor}}
+
+    def conversations_info(self, channel, **kwargs):
+        self._record('conversations.info')
+        for candidate in self.channels:
+            if candidate['id'] == channel:
+                return {'ok': True, 'channel': candidate}
+        return {'ok': False, 'error': 'channel_not_found'}
+
+    def conversations_history(self, channel, oldest=None, latest=None, cursor=None, limit=100, **kwargs):
+        self._record('conversations.history')
+        oldest = float(oldest) if oldest else 0.0
+        latest = float(latest) if latest else float('inf')
+        messages = [m for m in self._channel_history(channel) if oldest < float(m['ts']) <= latest]
+        page, next_cursor = self._page(messages, cursor, limit)
+        return {
+            'ok': True,
+            'messages': page,
+            'has_more': bool(next_cursor),
+            'response_metadata': {'next_cursor': next_cursor},
+        }
+
+    def conversations_replies(self, channel, ts, cursor=None, limit=100, **kwargs):
+        self._record('conversations.replies')
+        parent = next((m for m in self._channel_history(channel) if m['ts'] == ts), None)
+        if parent is None:
+            return {'ok': False, 'error': 'thread_not_found'}
+        rnd = random.Random(f'{self.spec.seed}:{channel}:{ts}')
+        replies = [parent] + [
+            {
+                'type': 'message',
+                'user': rnd.choice(self.users)['id'],
+                'ts': f'{float(ts) + i + 1:.6f}',
+                'thread_ts': ts,
+                'text': 'reply',
+            }
+            for i in range(parent.get('reply_count', 0))
+        ]
+        page, next_cursor = self._page(replies, cursor, limit)
+        return {
+            'ok': True,
+            'messages': page,
+            'has_more': bool(next_cursor),
+            'response_metadata': {'next_cursor': next_cursor},
+        }
+
+    def chat_postMessage(self, channel, text=None, **kwargs):
+        self._record('chat.postMessage')
+        return {'ok': True, 'channel': channel, 'ts': f'{time.time():.6f}'}
@@ -0,0 +1,144 @@
+import threading
+
+from activity_aggregator import EXCLUDED_SUBTYPES
+from activity_sketch import HyperLogLog
+
+
+def is_thread_start(message):
+    """返信の付いたスレッドの親メッセージか"""
+    return message.get('thread_ts') == message.get('ts') and message.get('reply_count', 0) > 0
+
+
+def is_thread_reply(message):
+    """スレッドの返信か（「チャンネルにも投稿」された返信を含む）"""
+    thread_ts = message.get('thread_ts')
+    return bool(thread_ts) and thread_ts != message.get('ts')
+
+
+def empty_channel_activity(precision=None):
+    """チャンネル1つ分の集計途中の状態
+
+    投稿者はユーザーIDの集合で持つ（precisionを指定したら人数だけを推定するHyperLogLogで持つ）。
+    """
+    posters = HyperLogLog(precision) if precision else set()
+    return {'posts': 0, 'threads': 0, 'replies': 0, 'reactions': 0, 'posters': posters}
+
+
+def reduce_channel_activity(activity, messages, bot_ids, is_reply=False, fetched_replies=False):
+    """メッセージを1回の走査でactivityに加える（APIは呼ばず、bot判定はbot_idsで行う）
+
+    投稿・スレッド・返信は次のように数え、同じ活動を2回数えない。
+      posts   … 人の投稿（スレッドの返信は含まない）
+      threads … 返信の付いたスレッドの数（親メッセージは投稿としても数える）
+      replies … fetched_replies=Trueなら、受け取った人の返信（is_reply=Trueの返信と「チャンネルにも投稿」
+                された返信）の数。Falseなら返信を取得していないため、親メッセージのreply_countの合計
+                （botの返信や期間外の返信も含む）
+    返信は投稿者とリアクションにも加える（postsには含めない）。
+    """
+    for message in messages:
+        reactions = message.get('reactions')
+        if reactions:
+            activity['reactions'] += sum(reaction['count'] for reaction in reactions)
+        if message.get('subtype') in EXCLUDED_SUBTYPES:
+            continue
+        reply = is_reply or is_thread_reply(message)
+        if not reply and is_thread_start(message):
+            activity['threads'] += 1
+            if not fetched_replies:
+                activity['replies'] += message['reply_count']
+        user_id = message.get('user')
+        if not user_id or user_id in bot_ids:
+            continue
+        activity['posters'].add(user_id)
+        if not reply:
+            activity['posts'] += 1
+        elif fetched_replies:
+            activity['replies'] += 1
+    return activity
+
+
+def channel_stats_from(activity):
+    """集計途中の状態をレポート用のチャンネル活動状況にする"""
+    return {
+        'posts': activity['posts'],
+        'replies': activity['replies'],
+        'threads': activity['threads'],
+        'unique_posters': len(activity['posters']),
+        'reactions': activity['reactions'],
+        'total_activity': activity['posts'] + activity['replies'],
+    }
+
+
+def analyze_channels(channel_messages, channels, bot_ids, fetched_replies=False):
+    """取得済みのチャンネル別メッセージから、チャンネル名をキーにしたチャンネル活動状況を返す
+
+    fetched_replies=Trueなら、channel_messagesにはスレッドの返信も含まれているものとして数える。
+    """
+    return {
+        channel['name']: channel_stats_from(
+            reduce_channel_activity(
+                empty_channel_activity(), channel_messages.get(channel['id'], []), bot_ids,
+                fetched_replies=fetched_replies
+            )
+        )
+        for channel in channels
+    }
+
+
+def posters_state(posters):
+    """投稿者をJSONで保存できる形にする"""
+    if isinstance(posters, HyperLogLog):
+        return posters.to_state()
+    return sorted(posters)
+
+
+class ChannelActivity:
+    """チャンネル活動状況をページごとに集計する（ActivityAggregatorと同じadd()を持つ）
+
+    bot判定は作成時に渡したbotのユーザーIDの集合で行うため、集計中にAPIを呼ばない。
+    precisionを指定すると参加人数をHyperLogLogで推定する（チャンネルの人数が増えてもメモリは一定）。
+    スレッドの返信も受け取るならfetched_replies=Trueにする（返信数を返信そのものから数える）。
+    """
+
+    def __init__(self, bot_ids, channel_ids, precision=None, fetched_replies=False):
+        self.bot_ids = frozenset(bot_ids)
+        self.fetched_replies = fetched_replies
+        self.activities = {channel_id: empty_channel_activity(precision) for channel_id in channel_ids}
+        self.lock = threading.Lock()
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        activity = self.activities.get(channel_id)
+        if activity is None:
+            return
+        with self.lock:
+            reduce_channel_activity(activity, messages, self.bot_ids, is_reply, self.fetched_replies)
+
+    def to_state(self):
+        """集計途中の状態をJSONで保存できる辞書にする（スナップショット用）"""
+        with self.lock:
+            return {
+                channel_id: {**activity, 'posters': posters_state(activity['posters'])}
+                for channel_id, activity in self.activities.items()
+            }
+
+    def merge_state(self, state):
+        """to_state()の結果を足し合わせる（投稿者は和集合）"""
+        with self.lock:
+            for channel_id, saved in state.items():
+                activity = self.activities.get(channel_id)
+                if activity is None:
+                    continue
+                for key in ('posts', 'threads', 'replies', 'reactions'):
+                    activity[key] += saved[key]
+                if isinstance(activity['posters'], HyperLogLog):
+                    activity['posters'].merge(HyperLogLog.from_state(saved['posters']))
+                else:
+                    activity['posters'].update(saved['posters'])
+
+    def channel_stats(self, channels):
+        """チャンネル名をキーにしたチャンネル活動状況を返す"""
+        with self.lock:
+            return {
+                channel['name']: channel_stats_from(self.activities.get(channel['id'], empty_channel_activity()))
+                for channel in channels
+            }
@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+
+
+# チャンネル一覧キャッシュの有効期限（秒）。デフォルトは1日
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class ChannelCatalog:
+    """チャンネル一覧のキャッシュ（パブリック・プライベートを1回の一覧取得で取得し、ファイルに保持）
+
+    チャンネルごとに最後に確認した最新メッセージの時刻も記録し、
+    長期間投稿のないチャンネルの履歴取得を省略できるようにする。
+    """
+
+    def __init__(self, client, cache_path=None, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.client = client
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self._channels = None
+        self._loaded_at = 0.0
+        # チャンネルID → {'latest_ts': 確認できた最新メッセージの時刻,
+        #                 'quiet_since': この時刻から checked_until まではメッセージがない,
+        #                 'checked_until': 確認した範囲の終わり, 'checked_at': 確認した時刻}
+        self._activity = {}
+        self._lock = threading.Lock()
+        self._load_from_disk()
+
+    def _load_from_disk(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"チャンネルキャッシュ読み込みエラー: {e}")
+            return
+
+        self._activity = data.get('activity', {})
+        if time.time() - data.get('loaded_at', 0) <= self.ttl_seconds:
+            self._channels = data.get('channels')
+            self._loaded_at = data.get('loaded_at', 0)
+
+    def save(self):
+        """チャンネル一覧と最新メッセージの記録をファイルに保存"""
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {'loaded_at': self._loaded_at, 'channels': self._channels, 'activity': self._activity}
+            try:
+                tmp_path = f"{self.cache_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                print(f"チャンネルキャッシュ保存エラー: {e}")
+
+    def list_channels(self):
+        """アーカイブ済みを除く全チャンネルを取得（キャッシュが有効期限内ならAPIを呼ばない）"""
+        with self._lock:
+            if self._channels is not None and time.time() - self._loaded_at <= self.ttl_seconds:
+                return self._channels
+
+            channels = []
+            cursor = None
+            while True:
+                response = self.client.conversations_list(
+                    types="public_channel,private_channel",
+                    exclude_archived=True,
+                    cursor=cursor,
+                    limit=1000
+                )
+                if not response['ok']:
+                    print(f"チャンネル一覧取得エラー: {response}")
+                    break
+                channels.extend(response['channels'])
+                cursor = response.get('response_metadata', {}).get('next_cursor')
+                if not cursor:
+                    break
+
+            self._channels = channels
+            self._loaded_at = time.time()
+        self.save()
+        return channels
+
+    def record_activity(self, channel_id, latest_ts, window_start_ts, window_end_ts):
+        """現在時刻までの履歴を取得したチャンネルについて、window_start_ts ～ window_end_ts の最新メッセージ時刻を記録
+
+        期間内にメッセージがなかった場合（latest_tsがNone）は、window_start_tsから投稿がないことを記録する
+        （前回の確認範囲とつながっていれば、前回から続けて投稿がないものとする）。
+        確認できた最新メッセージの時刻は小さくしない。過去の期間の取得は呼び出し側で記録しない。
+        """
+        with self._lock:
+            previous = self._activity.get(channel_id, {})
+            if previous.get('checked_until', 0) > window_end_ts:
+                # 前回の方が新しい範囲まで確認している
+                return
+            if latest_ts is not None:
+                quiet_since = latest_ts
+            elif previous.get('quiet_since') is not None and previous['checked_until'] >= window_start_ts:
+                quiet_since = min(previous['quiet_since'], window_start_ts)
+            else:
+                quiet_since = window_start_ts
+            known_latest = [ts for ts in (previous.get('latest_ts'), latest_ts) if ts is not None]
+            self._activity[channel_id] = {
+                'latest_ts': max(known_latest) if known_latest else None,
+                'quiet_since': quiet_since,
+                'checked_until': window_end_ts,
+                'checked_at': time.time(),
+            }
+
+    def is_dormant(self, channel_id, period_start_ts, recheck_seconds):
+        """期間の開始から確認した範囲の終わりまで投稿がなく、その終わりからrecheck_seconds以内のチャンネルか"""
+        info = self._activity.get(channel_id)
+        # 確認した範囲を記録していない以前の形式の記録は使わない
+        if not info or info.get('quiet_since') is None:
+            return False
+        return info['quiet_since'] <= period_start_ts and time.time() - info['checked_until'] < recheck_seconds
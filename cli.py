@@ -0,0 +1,82 @@
+"""Slack分析ツールのコマンドライン（run.py・send_dm.py・get_user_id.py をサブコマンドにまとめたもの）
+
+    python -m cli run [--post] [run.pyの引数 ...]   # 集計してレポートを作成（--postで続けて投稿）
+    python -m cli send [--file weekly_report.txt]    # 作成済みのレポートを投稿
+    python -m cli lookup [キーワード] [--fuzzy]       # ユーザーIDを検索
+
+起動を速くするため、各サブコマンドは必要なモジュールを実行するときに読み込む
+（send / lookup は集計用のモジュールやpytz・numpyを読み込まない）。
+run --post は集計と投稿を同じプロセス・同じクライアント（HTTP接続）で行い、
+レポートファイルを読み直さずに投稿する。
+"""
+
+import argparse
+import os
+import sys
+
+
+def command_run(args, run_argv):
+    import run
+
+    report = run.run_with_metrics(run_argv)
+    if not args.post:
+        return 0
+
+    channel_id = args.channel or os.getenv('SLACK_REPORT_CHANNEL_ID')
+    if not channel_id:
+        print("エラー: SLACK_REPORT_CHANNEL_ID が設定されていません")
+        return 1
+    from send_dm import post_report
+    # 集計に使ったクライアント（レート制限付き）をそのまま使って投稿する
+    return 0 if post_report(run.client, channel_id, report, run.report_key(report)) else 1
+
+
+def command_send(args):
+    from send_dm import send_report_to_channel
+
+    return 0 if send_report_to_channel(args.file, args.channel) else 1
+
+
+def command_lookup(lookup_argv):
+    from get_user_id import main as lookup_main
+
+    lookup_main(lookup_argv)
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cli', description="Slackの活動レポートの作成・投稿・ユーザー検索")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser(
+        'run', allow_abbrev=False, help="集計してレポートを作成（その他の引数は run.py にそのまま渡す）"
+    )
+    run_parser.add_argument('--post', action='store_true', help="作成したレポートを続けて投稿する")
+    run_parser.add_argument('--channel', help="投稿先のチャンネルID（省略時は SLACK_REPORT_CHANNEL_ID）")
+
+    send_parser = subparsers.add_parser('send', help="作成済みのレポートファイルを投稿")
+    send_parser.add_argument('--file', default=os.getenv('REPORT_PATH', 'weekly_report.txt'), help="投稿するレポートファイル")
+    send_parser.add_argument('--channel', help="投稿先のチャンネルID（省略時は SLACK_REPORT_CHANNEL_ID）")
+
+    subparsers.add_parser(
+        'lookup', add_help=False, help="実名・表示名・ユーザー名からユーザーIDを検索（引数は get_user_id.py にそのまま渡す）"
+    )
+
+    # run のオプション以外の引数（--days など）は run.py に、lookup の引数は get_user_id.py に渡す
+    args, rest = parser.parse_known_args(argv)
+    if rest and args.command == 'send':
+        parser.error(f"不明な引数: {' '.join(rest)}")
+    return args, rest
+
+
+def main(argv=None):
+    args, rest = parse_args(argv)
+    if args.command == 'run':
+        return command_run(args, rest)
+    if args.command == 'send':
+        return command_send(args)
+    return command_lookup(rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,69 +2,99 @@
 """
 SlackユーザーID取得ヘルパースクリプト
 「いち l AI就活（代表）」のユーザーIDを取得するためのスクリプト
+
+    python get_user_id.py                 # 'いち' で検索
+    python get_user_id.py たろう          # 前方一致・部分一致で検索（全角・半角、カタカナ・ひらがな、大文字・小文字は区別しない）
+    python get_user_id.py yamda --fuzzy   # 似た名前も検索
+    python get_user_id.py --refresh いち   # ユーザー一覧を取得し直してから検索
+
+全ユーザーをページごとに取得して検索用のインデックスを作り、USER_INDEX_PATHに保存する。
+2回目以降は有効期限（USER_INDEX_TTL）内であればAPIを呼ばずに検索する。
 """
 
+import argparse
 import os
-from slack_sdk.web import WebClient
 
-def get_user_id_by_name():
+from user_index import DEFAULT_TTL_SECONDS, UserIndex
+
+# 検索用インデックスの保存先と有効期限（秒）
+USER_INDEX_PATH = os.getenv('USER_INDEX_PATH', '.slack-cache/user_index.json')
+USER_INDEX_TTL = int(os.getenv('USER_INDEX_TTL', DEFAULT_TTL_SECONDS))
+
+def load_user_index(refresh=False):
     """
-    ユーザー名からユーザーIDを取得する
+    検索用インデックスを読み込む（保存済みのものがなければ全ユーザーを取得して作成）
     """
+    if not refresh:
+        index = UserIndex.load(USER_INDEX_PATH, USER_INDEX_TTL)
+        if index:
+            return index
+
     # 環境変数からトークンを取得
-    slack_token = os.getenv('SLACK_API_TOKEN')
-    
+    slack_token = os.getenv('SLACK_API_TOKEN') or os.getenv('SLACK_BOT_TOKEN')
+
     if not slack_token:
         print("エラー: SLACK_API_TOKENが設定されていません")
         print("環境変数を設定するか、以下のように実行してください：")
         print("SLACK_API_TOKEN=your_token python get_user_id.py")
-        return
-    
-    client = WebClient(token=slack_token)
-    
-    try:
-        # 全ユーザー情報を取得
-        response = client.users_list()
-        users = response['members']
-        
-        print("=== ユーザー一覧 ===")
-        print("検索キーワード: 'いち' を含むユーザー")
-        print()
-        
-        found_users = []
-        
-        for user in users:
-            real_name = user.get('real_name', '')
-            display_name = user.get('display_name', '')
-            user_id = user.get('id', '')
-            
-            # 'いち' を含むユーザーを検索
-            if 'いち' in real_name or 'いち' in display_name:
-                found_users.append({
-                    'id': user_id,
-                    'real_name': real_name,
-                    'display_name': display_name
-                })
-        
-        if found_users:
-            print("見つかったユーザー:")
-            for user in found_users:
-                print(f"  ID: {user['id']}")
-                print(f"  実名: {user['real_name']}")
-                print(f"  表示名: {user['display_name']}")
-                print()
-        else:
-            print("'いち' を含むユーザーが見つかりませんでした。")
+        return None
+
+    # slack_sdkの読み込みは時間がかかるため、APIを呼ぶときだけ読み込む
+    from slack_sdk.web import WebClient
+    from slack_rate_limit import RateLimitedClient
+    from user_directory import UserDirectory
+
+    # 全ユーザー情報をページごとに取得（レート制限に従って呼び出す）
+    directory = UserDirectory(RateLimitedClient(WebClient(token=slack_token)))
+    members = directory.members()
+    index = UserIndex.from_members(members)
+    if members:
+        index.save(USER_INDEX_PATH)
+    return index
+
+def get_user_id_by_name(keyword='いち', fuzzy=False, limit=20, refresh=False):
+    """
+    ユーザー名からユーザーIDを取得する（keywordで実名・表示名・ユーザー名を検索して表示）
+    """
+    index = load_user_index(refresh)
+    if index is None:
+        return []
+
+    results = index.search(keyword, limit=limit, fuzzy=fuzzy)
+
+    print("=== ユーザー一覧 ===")
+    print(f"検索キーワード: '{keyword}'（ユーザー数: {len(index.users)}）")
+    print()
+
+    if results:
+        print("見つかったユーザー:")
+        for user, match in results:
+            print(f"  ID: {user['id']}（{match}）")
+            print(f"  実名: {user['real_name']}")
+            print(f"  表示名: {user['display_name']}")
             print()
-            print("全ユーザー一覧（最初の10件）:")
-            for i, user in enumerate(users[:10]):
-                real_name = user.get('real_name', '')
-                display_name = user.get('display_name', '')
-                user_id = user.get('id', '')
-                print(f"  {i+1}. ID: {user_id}, 実名: {real_name}, 表示名: {display_name}")
-    
-    except Exception as e:
-        print(f"エラーが発生しました: {e}")
+    else:
+        print(f"'{keyword}' を含むユーザーが見つかりませんでした。")
+        if not fuzzy:
+            print("似た名前も探す場合は --fuzzy を指定してください。")
+        print()
+        print("全ユーザー一覧（最初の10件）:")
+        for i, user in enumerate(list(index.users.values())[:10]):
+            print(f"  {i+1}. ID: {user['id']}, 実名: {user['real_name']}, 表示名: {user['display_name']}")
+
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="実名・表示名・ユーザー名からSlackのユーザーIDを検索する")
+    parser.add_argument('keyword', nargs='?', default='いち', help="検索キーワード（デフォルト: いち）")
+    parser.add_argument('--fuzzy', action='store_true', help="似た名前も検索する")
+    parser.add_argument('--limit', type=int, default=20, help="表示する最大件数")
+    parser.add_argument('--refresh', action='store_true', help="保存済みのインデックスを使わず取得し直す")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    get_user_id_by_name(args.keyword, fuzzy=args.fuzzy, limit=args.limit, refresh=args.refresh)
 
 if __name__ == "__main__":
-    get_user_id_by_name()
+    main()
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class MessageStore:
+    """チャンネル履歴のローカル保存（SQLite）。チャンネルごとに同期済みの範囲を記録する
+
+    checkpointsテーブル:
+      synced_from / synced_ts … この範囲は取得完了している
+      pending_latest          … 実行中（または中断した）同期の上限時刻
+      pending_oldest          … 実行中の同期で取得済みの最も古い時刻
+    conversations_historyは新しい順に返すため、中断した同期は
+    synced_ts ～ pending_oldest の範囲だけを取得し直せば再開できる。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    channel_id TEXT NOT NULL,
+                    ts TEXT NOT NULL,
+                    ts_num REAL NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (channel_id, ts)
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    channel_id TEXT PRIMARY KEY,
+                    synced_from REAL,
+                    synced_ts REAL,
+                    pending_latest REAL,
+                    pending_oldest REAL,
+                    updated_at REAL
+                )
+            """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    channel_id TEXT NOT NULL,
+                    thread_ts TEXT NOT NULL,
+                    latest_reply TEXT NOT NULL,
+                    replies TEXT NOT NULL,
+                    PRIMARY KEY (channel_id, thread_ts)
+                )
+            """)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def get_checkpoint(self, channel_id):
+        """同期状況を辞書で返す（未同期のチャンネルは全ての値がNone）"""
+        with self.lock:
+            row = self.conn.execute(
+                """SELECT synced_from, synced_ts, pending_latest, pending_oldest
+                   FROM checkpoints WHERE channel_id = ?""",
+                (channel_id,)
+            ).fetchone()
+        keys = ('synced_from', 'synced_ts', 'pending_latest', 'pending_oldest')
+        return dict(zip(keys, row if row else (None,) * len(keys)))
+
+    def _update_checkpoint(self, channel_id, **fields):
+        fields['updated_at'] = time.time()
+        self.conn.execute("INSERT OR IGNORE INTO checkpoints (channel_id) VALUES (?)", (channel_id,))
+        assignments = ', '.join(f"{key} = ?" for key in fields)
+        self.conn.execute(
+            f"UPDATE checkpoints SET {assignments} WHERE channel_id = ?",
+            (*fields.values(), channel_id)
+        )
+
+    def begin_sync(self, channel_id, latest_ts):
+        """latest_tsまでの同期を開始したことを記録"""
+        with self.lock, self.conn:
+            self._update_checkpoint(channel_id, pending_latest=latest_ts, pending_oldest=latest_ts)
+
+    def save_page(self, channel_id, messages, track_progress=True):
+        """1ページ分のメッセージを保存し、同期の進捗を更新（同じtsのメッセージは上書き）"""
+        if not messages:
+            return
+        rows = [(channel_id, m['ts'], float(m['ts']), json.dumps(m, ensure_ascii=False)) for m in messages]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages (channel_id, ts, ts_num, data) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            # 1ページの保存と進捗の更新は同じトランザクションで行う
+            if track_progress:
+                self._update_checkpoint(channel_id, pending_oldest=min(row[2] for row in rows))
+
+    def complete_sync(self, channel_id, synced_from, synced_ts):
+        """synced_from ～ synced_ts の同期が完了したことを記録"""
+        with self.lock, self.conn:
+            self._update_checkpoint(
+                channel_id,
+                synced_from=synced_from,
+                synced_ts=synced_ts,
+                pending_latest=None,
+                pending_oldest=None
+            )
+
+    def get_thread(self, channel_id, thread_ts):
+        """保存済みのスレッド返信を (latest_reply, 返信のリスト) で返す（なければNone）"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT latest_reply, replies FROM threads WHERE channel_id = ? AND thread_ts = ?",
+                (channel_id, thread_ts)
+            ).fetchone()
+        if not row:
+            return None
+        return row[0], json.loads(row[1])
+
+    def save_thread(self, channel_id, thread_ts, latest_reply, replies):
+        """スレッド返信をlatest_replyとともに保存"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO threads (channel_id, thread_ts, latest_reply, replies) VALUES (?, ?, ?, ?)",
+                (channel_id, thread_ts, latest_reply, json.dumps(replies, ensure_ascii=False))
+            )
+
+    def iter_messages(self, channel_id, oldest_ts, latest_ts, page_size=1000):
+        """保存済みのメッセージを新しい順にpage_size件ずつ返す"""
+        upper = latest_ts
+        upper_op = '<='
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"""SELECT ts_num, data FROM messages
+                        WHERE channel_id = ? AND ts_num > ? AND ts_num {upper_op} ?
+                        ORDER BY ts_num DESC LIMIT ?""",
+                    (channel_id, oldest_ts, upper, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [json.loads(row[1]) for row in rows]
+            if len(rows) < page_size:
+                return
+            # 次のページは今回の最も古いメッセージより前から（tsはチャンネル内で一意）
+            upper = rows[-1][0]
+            upper_op = '<'
@@ -0,0 +1,273 @@
+import heapq
+import json
+import threading
+from array import array
+from collections import Counter
+
+
+# ユーザー番号2つ（リアクションをした人, 受けた人）を1つの整数のキーにまとめるときのシフト幅
+KEY_SHIFT = 32
+KEY_MASK = (1 << KEY_SHIFT) - 1
+
+
+def top_items(items, n, key, name):
+    """大きさn固定のヒープで上位n件を求める（全件を並べ替えない）
+
+    keyの値（数値または数値のタプル）が大きい順に並べ、同じ値ならname（ユーザーIDなど）の順で並びを固定する。
+    ユーザー番号は取得の終わった順に振られるため、番号で比べると実行のたびに並びが変わる。
+    """
+    def rank(item):
+        value = key(item)
+        values = value if isinstance(value, tuple) else (value,)
+        return tuple(-v for v in values), name(item)
+    return heapq.nsmallest(n, items, key=rank)
+
+
+class ReactionGraph:
+    """リアクションの「誰が誰に」を重み付きの有向グラフとして1回の走査で集計する
+
+    走査中は (リアクションをした人, 受けた人) の組を整数のキーにした辞書で数え、
+    finalize()で送り手ごとの隣接リスト（CSR形式: indptr／indices／weights の配列）にまとめる。
+    上位の問い合わせはどれも大きさの決まったヒープで求めるため、RANK_NUMBERを変えても
+    メッセージを走査し直す必要はない。ActivityAggregatorと同じadd()を持つ。
+    """
+
+    def __init__(self):
+        self.user_index = {}
+        self.users = []
+        self.emoji_index = {}
+        self.emojis = []
+        # (送り手 << 32 | 受け手) → 回数
+        self.edges = Counter()
+        # (絵文字 << 32 | ユーザー) → 回数
+        self.emoji_given = Counter()
+        self.emoji_received = Counter()
+        self.emoji_totals = Counter()
+        self._csr = None
+        self.lock = threading.Lock()
+
+    def _intern(self, index, values, key):
+        position = index.get(key)
+        if position is None:
+            position = index[key] = len(values)
+            values.append(key)
+        return position
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        """1ページ分のメッセージのリアクションを集計に加える"""
+        with self.lock:
+            self._csr = None
+            for message in messages:
+                reactions = message.get('reactions')
+                message_user = message.get('user')
+                if not reactions or not message_user:
+                    continue
+                receiver = self._intern(self.user_index, self.users, message_user)
+                for reaction in reactions:
+                    emoji = self._intern(self.emoji_index, self.emojis, reaction['name'])
+                    self.emoji_totals[emoji] += reaction['count']
+                    self.emoji_received[emoji << KEY_SHIFT | receiver] += reaction['count']
+                    for user_id in reaction['users']:
+                        giver = self._intern(self.user_index, self.users, user_id)
+                        self.edges[giver << KEY_SHIFT | receiver] += 1
+                        self.emoji_given[emoji << KEY_SHIFT | giver] += 1
+
+    def to_state(self):
+        """集計した組をユーザーID・絵文字名でJSONに保存できる辞書にする（スナップショット用）"""
+        def split(counts, names):
+            return [[names[key >> KEY_SHIFT], self.users[key & KEY_MASK], count] for key, count in counts.items()]
+
+        with self.lock:
+            return {
+                'edges': split(self.edges, self.users),
+                'emoji_given': split(self.emoji_given, self.emojis),
+                'emoji_received': split(self.emoji_received, self.emojis),
+                'emoji_totals': {self.emojis[emoji]: count for emoji, count in self.emoji_totals.items()},
+            }
+
+    def merge_state(self, state):
+        """to_state()の結果を足し合わせる"""
+        with self.lock:
+            self._csr = None
+            users = (self.user_index, self.users)
+            emojis = (self.emoji_index, self.emojis)
+            for counts, names, name_key in [
+                (self.edges, users, 'edges'),
+                (self.emoji_given, emojis, 'emoji_given'),
+                (self.emoji_received, emojis, 'emoji_received'),
+            ]:
+                for name, user_id, count in state[name_key]:
+                    counts[self._intern(*names, name) << KEY_SHIFT | self._intern(*users, user_id)] += count
+            for name, count in state['emoji_totals'].items():
+                self.emoji_totals[self._intern(*emojis, name)] += count
+
+    def finalize(self):
+        """辞書で数えた組を送り手ごとの隣接リスト（CSR形式）にまとめる"""
+        with self.lock:
+            if self._csr is not None:
+                return self._csr
+            indptr = array('i', [0] * (len(self.users) + 1))
+            indices = array('i')
+            weights = array('i')
+            for key in sorted(self.edges):
+                indptr[(key >> KEY_SHIFT) + 1] += 1
+                indices.append(key & KEY_MASK)
+                weights.append(self.edges[key])
+            for i in range(len(self.users)):
+                indptr[i + 1] += indptr[i]
+            self._csr = (indptr, indices, weights)
+            return self._csr
+
+    def _weight(self, giver, receiver):
+        return self.edges.get(giver << KEY_SHIFT | receiver, 0)
+
+    def top_givers(self, n):
+        """リアクションをした回数の上位n人を (ユーザーID, 回数) で返す"""
+        indptr, _, weights = self.finalize()
+        totals = ((giver, sum(weights[indptr[giver]:indptr[giver + 1]])) for giver in range(len(self.users)))
+        return [(self.users[giver], total) for giver, total in top_items(totals, n, key=lambda item: item[1], name=lambda item: self.users[item[0]]) if total]
+
+    def top_receivers(self, n):
+        """リアクションを受けた回数（リアクションした人が分かるもの）の上位n人を返す"""
+        _, indices, weights = self.finalize()
+        totals = Counter()
+        for receiver, weight in zip(indices, weights):
+            totals[receiver] += weight
+        return [
+            (self.users[receiver], total)
+            for receiver, total in top_items(
+                totals.items(), n, key=lambda item: item[1], name=lambda item: self.users[item[0]]
+            )
+        ]
+
+    def top_edges(self, n):
+        """「誰が誰にリアクションしたか」の上位n組を (送り手, 受け手, 回数) で返す（自分へのリアクションは除く）"""
+        edges = (
+            (key >> KEY_SHIFT, key & KEY_MASK, weight) for key, weight in self.edges.items()
+            if key >> KEY_SHIFT != key & KEY_MASK
+        )
+        return [
+            (self.users[giver], self.users[receiver], weight)
+            for giver, receiver, weight in top_items(
+                edges, n, key=lambda edge: edge[2], name=lambda edge: (self.users[edge[0]], self.users[edge[1]])
+            )
+        ]
+
+    def top_targets(self, user_id, n):
+        """指定したユーザーがよくリアクションする相手の上位n人を返す"""
+        giver = self.user_index.get(user_id)
+        if giver is None:
+            return []
+        indptr, indices, weights = self.finalize()
+        row = (
+            (indices[i], weights[i]) for i in range(indptr[giver], indptr[giver + 1])
+            if indices[i] != giver
+        )
+        return [
+            (self.users[receiver], weight)
+            for receiver, weight in top_items(row, n, key=lambda item: item[1], name=lambda item: self.users[item[0]])
+        ]
+
+    def mutual_pairs(self, n):
+        """お互いにリアクションし合っている上位n組を (ユーザーA, ユーザーB, A→B, B→A) で返す（AはIDの小さい方）
+
+        少ない方の回数（お互いにどれだけ反応し合っているか）で順位を付け、同じなら合計で比べる。
+        """
+        indptr, indices, weights = self.finalize()
+        pairs = []
+        for a in range(len(self.users)):
+            for i in range(indptr[a], indptr[a + 1]):
+                b = indices[i]
+                if b <= a:
+                    continue
+                back = self._weight(b, a)
+                if back:
+                    # ユーザーAはIDの小さい方にそろえる
+                    if self.users[a] < self.users[b]:
+                        pairs.append((a, b, weights[i], back))
+                    else:
+                        pairs.append((b, a, back, weights[i]))
+        return [
+            (self.users[a], self.users[b], forward, back)
+            for a, b, forward, back in top_items(
+                pairs, n, key=lambda pair: (min(pair[2], pair[3]), pair[2] + pair[3]),
+                name=lambda pair: (self.users[pair[0]], self.users[pair[1]])
+            )
+        ]
+
+    def emoji_leaders(self, n, per_emoji=1):
+        """よく使われた絵文字の上位n件と、それぞれをよく使った人・よくもらった人を返す"""
+        given = {}
+        received = {}
+        for counts, leaders in [(self.emoji_given, given), (self.emoji_received, received)]:
+            for key, count in counts.items():
+                leaders.setdefault(key >> KEY_SHIFT, []).append((key & KEY_MASK, count))
+        results = []
+        for emoji, total in top_items(
+            self.emoji_totals.items(), n, key=lambda item: item[1], name=lambda item: self.emojis[item[0]]
+        ):
+            results.append({
+                'emoji': self.emojis[emoji],
+                'count': total,
+                'top_givers': [
+                    (self.users[user], count)
+                    for user, count in top_items(
+                        given.get(emoji, []), per_emoji, key=lambda item: item[1], name=lambda item: self.users[item[0]]
+                    )
+                ],
+                'top_receivers': [
+                    (self.users[user], count)
+                    for user, count in top_items(
+                        received.get(emoji, []), per_emoji, key=lambda item: item[1],
+                        name=lambda item: self.users[item[0]]
+                    )
+                ],
+            })
+        return results
+
+    def summary_section(self, n=3):
+        """レポートに載せるリアクションのつながりのまとめ"""
+        pairs = self.mutual_pairs(n)
+        leaders = self.emoji_leaders(n)
+        if not pairs and not leaders:
+            return None
+        section = "■ リアクションでつながっている人たち"
+        for user_a, user_b, forward, back in pairs:
+            section += f"\n　<@{user_a}> ⇄ <@{user_b}>（{forward}回／{back}回）"
+        for leader in leaders:
+            section += f"\n　:{leader['emoji']}: {leader['count']}回"
+            if leader['top_receivers']:
+                user_id, count = leader['top_receivers'][0]
+                section += f"（いちばんもらったのは <@{user_id}>：{count}回）"
+        return section
+
+    def to_dict(self, n):
+        """上位n件ずつをファイル保存用の辞書にする"""
+        return {
+            'top_givers': [{'user': user, 'count': count} for user, count in self.top_givers(n)],
+            'top_receivers': [{'user': user, 'count': count} for user, count in self.top_receivers(n)],
+            'top_edges': [
+                {'from': giver, 'to': receiver, 'count': count} for giver, receiver, count in self.top_edges(n)
+            ],
+            'mutual_pairs': [
+                {'users': [user_a, user_b], 'counts': [forward, back]}
+                for user_a, user_b, forward, back in self.mutual_pairs(n)
+            ],
+            'emoji_leaders': [
+                {
+                    'emoji': leader['emoji'],
+                    'count': leader['count'],
+                    'top_givers': [{'user': user, 'count': count} for user, count in leader['top_givers']],
+                    'top_receivers': [{'user': user, 'count': count} for user, count in leader['top_receivers']],
+                }
+                for leader in self.emoji_leaders(n, per_emoji=3)
+            ],
+        }
+
+    def save(self, path, n):
+        """上位n件ずつをJSONで保存"""
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(n), f, ensure_ascii=False)
+        except OSError as e:
+            print(f"リアクションの集計の保存エラー: {e}")
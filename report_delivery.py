@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from slack_rate_limit import TokenBucket
+
+
+# Block Kitのsectionブロック1つに入れられる文字数
+SECTION_TEXT_LIMIT = 3000
+# 1つのメッセージに入れられるブロック数
+MAX_BLOCKS_PER_MESSAGE = 50
+# 1つのメッセージに入れる文字数の上限（長すぎるメッセージはSlack側で切り詰められるため分割する）
+MESSAGE_TEXT_LIMIT = 12000
+
+# chat.postMessageは1チャンネルあたり1秒に1回程度まで
+PER_CHANNEL_PER_MINUTE = 60
+
+# 実行するたびに変わる行（レポートの同一性の判定には使わない）
+RUN_TIME_PREFIX = '■ 実行時刻:'
+
+
+def split_long_text(text, limit):
+    """limit文字を超える段落を行単位で（1行が長すぎる場合は文字数で）分割する"""
+    if len(text) <= limit:
+        return [text]
+    pieces = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+        else:
+            pieces.append(current)
+            current = line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_sections(text, limit=SECTION_TEXT_LIMIT):
+    """レポートを段落の区切りでlimit文字以内のセクションに分ける"""
+    sections = []
+    current = ''
+    for paragraph in text.strip().split('\n\n'):
+        for piece in split_long_text(paragraph.strip('\n'), limit):
+            if not piece.strip():
+                continue
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if len(candidate) <= limit:
+                current = candidate
+            else:
+                sections.append(current)
+                current = piece
+    if current:
+        sections.append(current)
+    return sections
+
+
+def build_messages(text):
+    """レポートをBlock Kitのメッセージ（chat_postMessageの引数）のリストに分割する"""
+    messages = []
+    blocks = []
+    length = 0
+    for section in split_sections(text):
+        if blocks and (len(blocks) >= MAX_BLOCKS_PER_MESSAGE or length + len(section) > MESSAGE_TEXT_LIMIT):
+            messages.append(blocks)
+            blocks = []
+            length = 0
+        blocks.append({'type': 'section', 'text': {'type': 'mrkdwn', 'text': section}})
+        length += len(section)
+    if blocks:
+        messages.append(blocks)
+    # textは通知やBlock Kitを表示できない環境で使われるため、先頭のセクションを入れる
+    return [{'text': blocks[0]['text']['text'], 'blocks': blocks} for blocks in messages]
+
+
+def report_digest(text):
+    """レポート本文のハッシュ（実行時刻の行は除くため、同じ内容なら再実行しても同じ値になる）"""
+    content = '\n'.join(line for line in text.splitlines() if not line.startswith(RUN_TIME_PREFIX))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+
+
+def default_report_key(text):
+    """レポート本文から冪等性ログのキーを作る"""
+    return report_digest(text)
+
+
+class DeliveryLog:
+    """投稿済みのメッセージを記録する（同じレポートを再実行しても二重投稿しないため）
+
+    1行1件のJSONで追記する。path未設定ならメモリ上のみ。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.posted = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self.posted[entry['key']] = entry
+            except (OSError, ValueError) as e:
+                print(f"投稿ログ読み込みエラー: {e}")
+
+    @staticmethod
+    def entry_key(report_key, destination, index):
+        return f"{report_key}:{destination}:{index}"
+
+    def is_posted(self, report_key, destination, index):
+        return self.entry_key(report_key, destination, index) in self.posted
+
+    def record(self, report_key, destination, index, ts):
+        entry = {
+            'key': self.entry_key(report_key, destination, index),
+            'destination': destination,
+            'index': index,
+            'ts': ts,
+            'posted_at': time.time(),
+        }
+        with self.lock:
+            self.posted[entry['key']] = entry
+            if not self.path:
+                return
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            except OSError as e:
+                print(f"投稿ログ保存エラー: {e}")
+
+
+class ReportDelivery:
+    """レポートを複数の投稿先（チャンネルID・ユーザーID）に分割して投稿する
+
+    投稿先ごとに並列に投稿し、同じチャンネルへの投稿はチャンネルごとのトークンバケットで間隔を空ける。
+    投稿したメッセージはDeliveryLogに記録し、再実行時は投稿済みのメッセージを飛ばす。
+    """
+
+    def __init__(self, client, log_path=None, workers=4, per_channel_per_minute=PER_CHANNEL_PER_MINUTE):
+        self.client = client
+        self.log = DeliveryLog(log_path)
+        self.workers = workers
+        self.per_channel_per_minute = per_channel_per_minute
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, channel_id):
+        with self.lock:
+            if channel_id not in self.buckets:
+                self.buckets[channel_id] = TokenBucket(self.per_channel_per_minute, burst=1)
+            return self.buckets[channel_id]
+
+    def _resolve_channel(self, destination):
+        """ユーザーIDならDMのチャンネルを開く（開けなければユーザーIDのまま投稿する）"""
+        if not destination.startswith(('U', 'W')):
+            return destination
+        try:
+            response = self.client.conversations_open(users=destination)
+            if response['ok']:
+                return response['channel']['id']
+        except Exception as e:
+            print(f"DMを開けませんでした（{destination}）: {e}")
+        return destination
+
+    def _deliver_to(self, destination, messages, report_key):
+        result = {'posted': 0, 'skipped': 0, 'error': None}
+        pending = [
+            (index, message) for index, message in enumerate(messages)
+            if not self.log.is_posted(report_key, destination, index)
+        ]
+        result['skipped'] = len(messages) - len(pending)
+        if not pending:
+            return result
+
+        channel_id = self._resolve_channel(destination)
+        bucket = self._bucket(channel_id)
+        for index, message in pending:
+            bucket.acquire()
+            try:
+                response = self.client.chat_postMessage(channel=channel_id, **message)
+            except Exception as e:
+                result['error'] = str(e)
+                break
+            if not response['ok']:
+                result['error'] = str(response.get('error', response))
+                break
+            self.log.record(report_key, destination, index, response.get('ts'))
+            result['posted'] += 1
+        return result
+
+    def deliver(self, text, destinations, report_key=None):
+        """レポートを全ての投稿先に投稿し、投稿先 → {'posted', 'skipped', 'error'} を返す"""
+        messages = build_messages(text)
+        report_key = report_key or default_report_key(text)
+        destinations = list(dict.fromkeys(destinations))
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(destinations) or 1))) as executor:
+            futures = {
+                executor.submit(self._deliver_to, destination, messages, report_key): destination
+                for destination in destinations
+            }
+            for future in as_completed(futures):
+                destination = futures[future]
+                try:
+                    results[destination] = future.result()
+                except Exception as e:
+                    results[destination] = {'posted': 0, 'skipped': 0, 'error': str(e)}
+        return results
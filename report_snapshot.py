@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import time
+
+
+# 集計の中身（to_state()の形式）を変えたら上げる（古いスナップショットは使わない）
+SNAPSHOT_VERSION = 1
+
+# これより古いスナップショットは削除する（前期間との比較に使うため、月次の集計でも残る長さにする）
+RETENTION_SECONDS = 70 * 24 * 60 * 60
+
+
+def snapshot_key(workspace, first_day, last_day, channel_ids, target_channel_ids, include_replies,
+                 engine='stream'):
+    """スナップショットのキー（ワークスペース・期間の日付・チャンネル構成・集計設定のハッシュ）
+
+    engineは集計エンジン（stream / sketch）。エンジンによってto_state()の形式が違う。
+    """
+    content = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'workspace': workspace,
+        'period': [first_day, last_day],
+        'channels': sorted(channel_ids),
+        'targets': sorted(target_channel_ids),
+        'include_replies': include_replies,
+        'engine': engine,
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()[:24]
+
+
+def new_snapshot(key):
+    return {'key': key, 'version': SNAPSHOT_VERSION, 'channels': {}}
+
+
+class SnapshotStore:
+    """チャンネルごとの集計結果（スナップショット）をキーごとのJSONファイルに保存する
+
+    チャンネルごとに、集計した期間（start_ts ～ end_ts）、期間内の最新・最古のメッセージの時刻、
+    保存した時刻と、各集計のto_state()を持つ。
+    """
+
+    def __init__(self, directory, ttl_seconds):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        """保存済みのスナップショットを読み込む（なければNone）"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"スナップショット読み込みエラー: {e}")
+            return None
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def save(self, snapshot):
+        """スナップショットを保存し、保存期間を過ぎたものを削除する"""
+        try:
+            path = self._path(snapshot['key'])
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"スナップショット保存エラー: {e}")
+        self.prune()
+
+    def prune(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.json') and now - os.path.getmtime(path) > RETENTION_SECONDS:
+                    os.remove(path)
+            except OSError as e:
+                print(f"スナップショット削除エラー: {e}")
+
+    def is_reusable(self, entry, latest_ts, start_ts, end_ts):
+        """保存済みのチャンネルの集計を今回の期間にそのまま使えるか
+
+        期間内の最新のメッセージが変わっておらず（新しい投稿がない）、前回集計したメッセージが
+        今回の期間の外に出ていなければ、今回の期間のメッセージは前回と同じになる。
+        リアクション・返信の増加を拾うため、ttl_secondsを過ぎた集計は使わない。
+        """
+        if not entry or time.time() - entry['saved_at'] > self.ttl_seconds:
+            return False
+        if entry['latest_ts'] != latest_ts or entry['end_ts'] > end_ts:
+            return False
+        if entry['start_ts'] > start_ts:
+            return False
+        return entry['oldest_ts'] is None or entry['oldest_ts'] > start_ts
+
+    @staticmethod
+    def record(snapshot, channel_id, start_ts, end_ts, latest_ts, oldest_ts, states):
+        """チャンネルの集計結果をスナップショットに記録する"""
+        snapshot['channels'][channel_id] = {
+            'start_ts': start_ts,
+            'end_ts': end_ts,
+            'latest_ts': latest_ts,
+            'oldest_ts': oldest_ts,
+            'saved_at': time.time(),
+            'states': states,
+        }
+
+
+def ranking_changes(current, previous):
+    """今回と前回の (キー, 件数) のランキングから、キー → (前回の順位, 前回の件数) を返す
+
+    前回のランキングにないキーは (None, 0)。
+    """
+    previous_ranks = {key: (rank, count) for rank, (key, count) in enumerate(previous, 1)}
+    return {key: previous_ranks.get(key, (None, 0)) for key, _ in current}
+
+
+def format_rank_move(rank, previous_rank):
+    """順位の変化を「↑2」「↓1」「→」「NEW」の形式で返す"""
+    if previous_rank is None:
+        return "NEW"
+    if previous_rank > rank:
+        return f"↑{previous_rank - rank}"
+    if previous_rank < rank:
+        return f"↓{rank - previous_rank}"
+    return "→"
@@ -0,0 +1,244 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytz
+
+from activity_aggregator import EXCLUDED_SUBTYPES, empty_channel_stats
+from channel_activity import is_thread_reply, is_thread_start
+
+
+JST = pytz.timezone('Asia/Tokyo')
+
+# ユーザー単位の集計項目と、チャンネル単位の集計項目
+USER_METRICS = ('posts', 'reactions_given', 'reactions_received')
+CHANNEL_METRICS = ('messages', 'threads', 'replies')
+# チャンネル単位の行はuser_idを空文字にして保存する
+# （チャンネル単位の行のposts・reactions_receivedには、チャンネルの投稿数・リアクション数を入れる）
+CHANNEL_ROW = ''
+
+
+def jst_day(ts):
+    """メッセージのtsからJSTの日付（YYYY-MM-DD）を求める"""
+    return datetime.fromtimestamp(float(ts), JST).strftime('%Y-%m-%d')
+
+
+def day_range(start_time, end_time):
+    """期間に含まれるJSTの日付（YYYY-MM-DD）の最初と最後を返す"""
+    return jst_day(start_time.timestamp()), jst_day(end_time.timestamp())
+
+
+class RollupBuilder:
+    """取得したメッセージを日別・チャンネル別・ユーザー別の件数にまとめる
+
+    ActivityAggregatorと同じadd()で受け取るため、同じ走査の中で一緒に更新できる。
+    リアクションの付いた時刻はAPIから取れないため、メッセージの投稿日に計上する。
+    チャンネル単位の件数はchannel_activity.reduce_channel_activity()と同じ数え方をする
+    （fetched_replies=Trueなら返信数を返信そのものから、返信の投稿日に数える）。
+    """
+
+    def __init__(self, is_bot_user, fetched_replies=False):
+        self.is_bot_user = is_bot_user
+        self.fetched_replies = fetched_replies
+        self.counts = defaultdict(lambda: dict.fromkeys(USER_METRICS + CHANNEL_METRICS, 0))
+        self.lock = threading.Lock()
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        human_posts = [
+            message.get('subtype') not in EXCLUDED_SUBTYPES
+            and bool(message.get('user')) and not self.is_bot_user(message['user'])
+            for message in messages
+        ]
+        with self.lock:
+            for message, is_human_post in zip(messages, human_posts):
+                day = jst_day(message['ts'])
+                channel_row = self.counts[(day, channel_id, CHANNEL_ROW)]
+                channel_row['messages'] += 1
+
+                if is_human_post:
+                    self.counts[(day, channel_id, message['user'])]['posts'] += 1
+
+                if 'reactions' in message:
+                    reaction_total = sum(reaction['count'] for reaction in message['reactions'])
+                    channel_row['reactions_received'] += reaction_total
+                    for reaction in message['reactions']:
+                        for user_id in reaction['users']:
+                            self.counts[(day, channel_id, user_id)]['reactions_given'] += 1
+                    if message.get('user'):
+                        self.counts[(day, channel_id, message['user'])]['reactions_received'] += reaction_total
+
+                if message.get('subtype') in EXCLUDED_SUBTYPES:
+                    continue
+                if is_reply or is_thread_reply(message):
+                    if is_human_post and self.fetched_replies:
+                        channel_row['replies'] += 1
+                    continue
+                if is_human_post:
+                    channel_row['posts'] += 1
+                if is_thread_start(message):
+                    channel_row['threads'] += 1
+                    # 返信を取得していなければ親メッセージのreply_countで数える
+                    if not self.fetched_replies:
+                        channel_row['replies'] += message['reply_count']
+
+    def discard(self, channel_ids):
+        """指定したチャンネルの集計を捨てる（取得が完了しなかったチャンネルを保存しないため）"""
+        channel_ids = set(channel_ids)
+        if not channel_ids:
+            return
+        with self.lock:
+            for key in [key for key in self.counts if key[1] in channel_ids]:
+                del self.counts[key]
+
+
+class RollupStore:
+    """日別の集計結果（ロールアップ）をSQLiteに保存し、任意の期間を合算して返す"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        columns = ', '.join(f"{metric} INTEGER NOT NULL DEFAULT 0" for metric in USER_METRICS + CHANNEL_METRICS)
+        with self.lock, self.conn:
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS daily_rollups (
+                    day TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    {columns},
+                    PRIMARY KEY (day, channel_id, user_id)
+                )
+            """)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def save(self, builder, first_day, last_day):
+        """first_day ～ last_day の日付の集計を置き換える（途中から始まる日・途中で終わる日は保存しない）"""
+        metrics = USER_METRICS + CHANNEL_METRICS
+        rows = [
+            (day, channel_id, user_id, *(counts[metric] for metric in metrics))
+            for (day, channel_id, user_id), counts in builder.counts.items()
+            if first_day <= day <= last_day
+        ]
+        days = sorted({row[0] for row in rows})
+        channel_ids = sorted({row[1] for row in rows})
+        with self.lock, self.conn:
+            # 取得し直した日・チャンネルの古い集計を削除してから書き込む
+            for day in days:
+                self.conn.executemany(
+                    "DELETE FROM daily_rollups WHERE day = ? AND channel_id = ?",
+                    [(day, channel_id) for channel_id in channel_ids]
+                )
+            self.conn.executemany(
+                f"""INSERT INTO daily_rollups (day, channel_id, user_id, {', '.join(metrics)})
+                    VALUES (?, ?, ?, {', '.join('?' for _ in metrics)})""",
+                rows
+            )
+        return len(days)
+
+    def activity(self, first_day, last_day):
+        """first_day ～ last_day の集計結果を返す"""
+        return RollupActivity(self, first_day, last_day)
+
+
+class RollupActivity:
+    """ロールアップを合算した集計結果（ActivityAggregatorと同じtop()／channel_stats()を持つ）"""
+
+    def __init__(self, store, first_day, last_day):
+        self.store = store
+        self.first_day = first_day
+        self.last_day = last_day
+
+    def _query(self, sql, params=()):
+        with self.store.lock:
+            return self.store.conn.execute(sql, (self.first_day, self.last_day, *params)).fetchall()
+
+    @property
+    def message_count(self):
+        row = self._query(
+            "SELECT COALESCE(SUM(messages), 0) FROM daily_rollups WHERE day BETWEEN ? AND ? AND user_id = ?",
+            (CHANNEL_ROW,)
+        )
+        return row[0][0]
+
+    def total(self, metric):
+        """期間全体の合計"""
+        if metric not in USER_METRICS:
+            raise ValueError(f"未対応の集計項目: {metric}")
+        row = self._query(
+            f"SELECT COALESCE(SUM({metric}), 0) FROM daily_rollups WHERE day BETWEEN ? AND ? AND user_id != ?",
+            (CHANNEL_ROW,)
+        )
+        return row[0][0]
+
+    def top(self, metric, n):
+        """上位n件を (ユーザーID, 件数) のリストで返す"""
+        if metric not in USER_METRICS:
+            raise ValueError(f"未対応の集計項目: {metric}")
+        return self._query(
+            f"""SELECT user_id, SUM({metric}) AS total FROM daily_rollups
+                WHERE day BETWEEN ? AND ? AND user_id != ?
+                GROUP BY user_id HAVING total > 0
+                ORDER BY total DESC, user_id LIMIT ?""",
+            (CHANNEL_ROW, n)
+        )
+
+    def channel_stats(self, channels):
+        """チャンネル名をキーにしたチャンネル活動状況を返す"""
+        rows = self._query(
+            """SELECT channel_id,
+                      SUM(CASE WHEN user_id = channel_row THEN posts ELSE 0 END),
+                      SUM(threads), SUM(replies),
+                      COUNT(DISTINCT CASE WHEN user_id != channel_row AND posts > 0 THEN user_id END),
+                      SUM(CASE WHEN user_id = channel_row THEN reactions_received ELSE 0 END)
+               FROM (SELECT * FROM daily_rollups WHERE day BETWEEN ? AND ?), (SELECT ? AS channel_row)
+               GROUP BY channel_id""",
+            (CHANNEL_ROW,)
+        )
+        totals = {row[0]: row[1:] for row in rows}
+        channel_stats = {}
+        for channel in channels:
+            stats = empty_channel_stats()
+            if channel['id'] in totals:
+                (stats['posts'], stats['threads'], stats['replies'],
+                 stats['unique_posters'], stats['reactions']) = totals[channel['id']]
+            stats['total_activity'] = stats['posts'] + stats['replies']
+            channel_stats[channel['name']] = stats
+        return channel_stats
+
+
+def to_jst(time):
+    return time.astimezone(JST) if time.tzinfo else JST.localize(time)
+
+
+def day_start(time):
+    """その日のJSTの0時"""
+    return JST.localize(to_jst(time).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None))
+
+
+def first_full_day(start_time):
+    """期間内で0時から始まる最初のJSTの日付（途中から始まる日は日別集計に保存しない）"""
+    start = to_jst(start_time)
+    if start.hour == start.minute == start.second == start.microsecond == 0:
+        return start.strftime('%Y-%m-%d')
+    return (start + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def last_full_day(end_time):
+    """期間内で24時まで含まれる最後のJSTの日付（実行日のように途中で終わる日は日別集計に保存しない）"""
+    end = to_jst(end_time)
+    if (end.hour, end.minute, end.second) == (23, 59, 59):
+        return end.strftime('%Y-%m-%d')
+    return (end - timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def previous_day_range(first_day, last_day):
+    """直前の同じ日数の期間（YYYY-MM-DD）を返す（前週比などの比較用）"""
+    first = datetime.strptime(first_day, '%Y-%m-%d')
+    last = datetime.strptime(last_day, '%Y-%m-%d')
+    previous_last = first - timedelta(days=1)
+    previous_first = previous_last - (last - first)
+    return previous_first.strftime('%Y-%m-%d'), previous_last.strftime('%Y-%m-%d')
@@ -1,9 +1,28 @@
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import functools
 import time
 import pytz
 import os
 from datetime import datetime, timedelta
 from slack_sdk.web import WebClient
+from activity_aggregator import ActivityAggregator
+from activity_columns import ActivityColumns
+from activity_heatmap import ActivityHeatmap
+from activity_sketch import ActivitySketch, DEFAULT_CAPACITY, DEFAULT_PRECISION, DEFAULT_SAMPLE_SIZE
+from channel_activity import ChannelActivity
+from channel_catalog import ChannelCatalog
+from message_store import MessageStore
+from reaction_graph import ReactionGraph
+from report_delivery import report_digest
+from report_snapshot import SnapshotStore, format_rank_move, new_snapshot, ranking_changes, snapshot_key
+from slack_export import SlackExport
+from rollups import (JST, RollupBuilder, RollupStore, day_range, day_start, first_full_day, last_full_day,
+                     previous_day_range)
+from slack_rate_limit import RateLimitedClient, RateLimiter, backoff_seconds, is_channel_access_error
+from telemetry import Telemetry
+from term_index import TermIndex, TermIndexBuilder
+from user_directory import UserDirectory, DEFAULT_TTL_SECONDS
 
 
 # 期間設定オプション
@@ -16,6 +35,18 @@ START_JST = END_JST - timedelta(days=DAYS_BACK)
 # 代替手段: 特定期間に設定したい場合は以下を使用して上記をコメントアウト
 # START_JST = datetime(2025, 9, 1, 0, 0, 0)
 # END_JST = datetime(2025, 9, 22, 23, 59, 59)
+# （コマンドラインの --period / --days / --start / --end でも指定できる）
+
+# レポート内での期間の呼び方
+PERIOD_LABEL = "今週"
+# 期間が現在時刻までか（過去の期間の集計では、投稿のないチャンネルの判定に使う最新メッセージの時刻を記録しない）
+PERIOD_ENDS_NOW = True
+
+# --periodで指定できる期間（日数と呼び方）
+PERIODS = {
+    'week': (DAYS_BACK, "今週"),
+    'month': (30, "今月"),
+}
 
 # トークン（環境変数から取得、なければデフォルト値を使用）
 SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN', "YOUR_SLACK_TOKEN_HERE")
@@ -32,66 +63,134 @@ TARGET_CHANNELS = [
     "86_n8n-dify-zapier",
     "87_画像生成ai"
 ]
-# 上位いくつまでを集計するか。
-RANK_NUMBER = 10
+# 環境変数TARGET_CHANNELS（カンマ区切り）が設定されていればそちらを使う（batch_run.pyで使用）
+if os.getenv('TARGET_CHANNELS'):
+    TARGET_CHANNELS = [name.strip() for name in os.getenv('TARGET_CHANNELS').split(',') if name.strip()]
 
-# Slackクライアントの初期化
-client = WebClient(token=SLACK_BOT_TOKEN)
+# レポートの保存先（send_dm.pyが読み込む）
+REPORT_PATH = os.getenv('REPORT_PATH', 'weekly_report.txt')
+# 上位いくつまでを集計するか。（レポートの各ランキングと、リアクションのつながりの集計ファイルに出力する件数）
+RANK_NUMBER = int(os.getenv('RANK_NUMBER', '3'))
 
-def get_channel_name(channel_id):
-    """チャンネルIDからチャンネル名を取得"""
-    try:
-        response = client.conversations_info(channel=channel_id)
-        return f"#{response['channel']['name']}"
-    except Exception as e:
-        print(f"チャンネル名取得エラー: {e}")
-        return f"#{channel_id}"
+# ユーザー情報キャッシュの保存先（未設定ならメモリ上のみ）と有効期限（秒）
+USER_CACHE_PATH = os.getenv('USER_CACHE_PATH')
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', DEFAULT_TTL_SECONDS))
+
+# チャンネル履歴を並列取得するスレッド数（1にすると逐次取得）
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+
+# 取得済みメッセージのローカル保存先（SQLite）。設定すると前回の続きから差分だけ取得する
+MESSAGE_STORE_PATH = os.getenv('MESSAGE_STORE_PATH')
+# 差分取得時に前回の同期位置からさかのぼる時間（この間のリアクションや編集を反映するため）
+SYNC_OVERLAP_HOURS = float(os.getenv('SYNC_OVERLAP_HOURS', '24'))
+
+# 履歴の取得に失敗したチャンネルを再試行する回数（取得済みのページの続きから再開する）
+# 再試行しても取得できなかったチャンネルは、取得できた分だけ集計してレポートに明記する
+CHANNEL_RETRY_ROUNDS = int(os.getenv('CHANNEL_RETRY_ROUNDS', '2'))
+
+# スレッド返信も取得して集計に含めるか（conversations_repliesをスレッドごとに呼び出す）
+INCLUDE_THREAD_REPLIES = os.getenv('INCLUDE_THREAD_REPLIES', '0') == '1'
+
+# --export でエクスポート（ZIP）から集計するときに日別ファイルを読み込むプロセス数（0ならCPU数）
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '0'))
+
+# 集計エンジン（stream: ページごとにCounterを更新 / columnar: 列指向の配列に展開してnumpyで集計 /
+# sketch: 固定サイズの要約で近似集計し、ユーザー数が増えてもメモリ使用量を一定に保つ）
+ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'stream')
+# sketchエンジンの設定（人数推定のレジスタ数は2のSKETCH_PRECISION乗、ランキングで件数を数えるユーザー数の上限、
+# レポートに載せるピックアップ投稿の数）
+SKETCH_PRECISION = int(os.getenv('SKETCH_PRECISION', DEFAULT_PRECISION))
+SKETCH_CAPACITY = int(os.getenv('SKETCH_CAPACITY', DEFAULT_CAPACITY))
+SKETCH_SAMPLE_SIZE = int(os.getenv('SKETCH_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE))
+
+# 日別集計（ロールアップ）の保存先（SQLite）。設定すると取得したデータを日別に保存し、
+# --from-rollups / --compare で再取得せずに任意の期間を集計できる
+ROLLUP_PATH = os.getenv('ROLLUP_PATH')
+
+# キーワード索引（SQLite）の保存先。設定すると指定チャンネルの本文を日別の単語の出現数として保存し、
+# 話題のキーワード・ツールの言及数の前期間比をレポートに載せる（前期間のメッセージは再取得しない）
+TERM_INDEX_PATH = os.getenv('TERM_INDEX_PATH')
+
+# チャンネル一覧キャッシュの保存先（未設定ならメモリ上のみ）と有効期限（秒）
+CHANNEL_CACHE_PATH = os.getenv('CHANNEL_CACHE_PATH')
+CHANNEL_CACHE_TTL = int(os.getenv('CHANNEL_CACHE_TTL', 24 * 60 * 60))
+# 期間の開始より前から投稿のないチャンネルの履歴取得を省略する日数（0なら省略しない）
+# この日数が経つと、投稿がないままでも改めて履歴を確認する
+DORMANT_RECHECK_DAYS = float(os.getenv('DORMANT_RECHECK_DAYS', '0'))
+
+# チャンネルごとの集計結果（スナップショット）の保存先ディレクトリ。設定すると、同じ期間の再実行では
+# 期間内の最新の投稿が変わっていないチャンネルを取得し直さず、前期間のスナップショットがあれば
+# 順位の変化をレポートに載せる
+REPORT_SNAPSHOT_DIR = os.getenv('REPORT_SNAPSHOT_DIR')
+# スナップショットを再利用する期限（秒）。過ぎたチャンネルはリアクション・返信の増加を拾うため取得し直す
+REPORT_SNAPSHOT_TTL = int(os.getenv('REPORT_SNAPSHOT_TTL', 6 * 60 * 60))
+
+# 曜日×時間帯（JST）の投稿数ヒートマップの保存先（空文字で保存しない）
+HEATMAP_PATH = os.getenv('HEATMAP_PATH', 'weekly_report_heatmap.json')
+
+# リアクションの「誰が誰に」の集計（上位RANK_NUMBER件ずつ）の保存先（空文字で保存しない）
+REACTION_GRAPH_PATH = os.getenv('REACTION_GRAPH_PATH', 'weekly_report_reactions.json')
+
+# 計測結果（API呼び出し回数・レイテンシ・各ステージの時間）の保存先と形式（json / prometheus）
+METRICS_PATH = os.getenv('METRICS_PATH', 'weekly_report_metrics.json')
+METRICS_FORMAT = os.getenv('METRICS_FORMAT', 'json')
+# 設定するとcProfileでプロファイルを取り、このファイルに保存する
+PROFILE_PATH = os.getenv('PROFILE_PATH')
+
+# API呼び出しと処理ステージの計測
+telemetry = Telemetry()
+
+# Slackクライアントの初期化（APIメソッドごとのレート制限ティアに従って呼び出す）
+client = RateLimitedClient(WebClient(token=SLACK_BOT_TOKEN), RateLimiter(telemetry=telemetry))
+# ユーザー情報は一括取得してキャッシュする（メッセージごとのusers_info呼び出しを避ける）
+user_directory = UserDirectory(client, cache_path=USER_CACHE_PATH, ttl_seconds=USER_CACHE_TTL)
+# チャンネル一覧もキャッシュする（一覧取得は1回の呼び出しでパブリック・プライベートをまとめて取得）
+channel_catalog = ChannelCatalog(client, cache_path=CHANNEL_CACHE_PATH, ttl_seconds=CHANNEL_CACHE_TTL)
+
+def open_message_store(path):
+    """メッセージ保存先を開く（未設定ならNone）"""
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return MessageStore(path)
+
+message_store = open_message_store(MESSAGE_STORE_PATH)
+
+def open_rollup_store(path):
+    """ロールアップの保存先を開く（未設定ならNone）"""
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return RollupStore(path)
+
+rollup_store = open_rollup_store(ROLLUP_PATH)
+
+def open_term_index(path):
+    """キーワード索引の保存先を開く（未設定ならNone）"""
+    if not path:
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return TermIndex(path)
+
+term_index = open_term_index(TERM_INDEX_PATH)
+
+snapshot_store = SnapshotStore(REPORT_SNAPSHOT_DIR, REPORT_SNAPSHOT_TTL) if REPORT_SNAPSHOT_DIR else None
 
 def get_all_channels():
-    """全てのチャンネルを取得"""
+    """全てのチャンネルを取得（アーカイブ済みを除く。チャンネル一覧キャッシュを使用）"""
     try:
-        # パブリックチャンネルを取得
-        public_channels = []
-        cursor = None
-        while True:
-            response = client.conversations_list(
-                types="public_channel",
-                cursor=cursor,
-                limit=1000
-            )
-            if response['ok']:
-                public_channels.extend(response['channels'])
-                cursor = response.get('response_metadata', {}).get('next_cursor')
-                if not cursor:
-                    break
-            else:
-                print(f"パブリックチャンネル取得エラー: {response}")
-                break
-        
-        # プライベートチャンネルを取得
-        private_channels = []
-        cursor = None
-        while True:
-            response = client.conversations_list(
-                types="private_channel",
-                cursor=cursor,
-                limit=1000
-            )
-            if response['ok']:
-                private_channels.extend(response['channels'])
-                cursor = response.get('response_metadata', {}).get('next_cursor')
-                if not cursor:
-                    break
-            else:
-                print(f"プライベートチャンネル取得エラー: {response}")
-                break
-        
-        # 全てのチャンネルを結合
-        all_channels = public_channels + private_channels
+        all_channels = channel_catalog.list_channels()
+        private_count = sum(1 for channel in all_channels if channel.get('is_private'))
         
         print(f"取得したチャンネル数: {len(all_channels)}")
-        print(f"パブリックチャンネル: {len(public_channels)}")
-        print(f"プライベートチャンネル: {len(private_channels)}")
+        print(f"パブリックチャンネル: {len(all_channels) - private_count}")
+        print(f"プライベートチャンネル: {private_count}")
         
         return all_channels
         
@@ -99,10 +198,25 @@ def get_all_channels():
         print(f"チャンネル取得エラー: {e}")
         return []
 
-def get_target_channels():
-    """指定された7つのチャンネルのみを取得"""
+def skip_dormant_channels(channels, start_time):
+    """期間の開始より前から投稿のないチャンネルを除く（DORMANT_RECHECK_DAYSが0なら除かない）"""
+    if DORMANT_RECHECK_DAYS <= 0:
+        return channels
+    start_ts = start_time.timestamp()
+    recheck_seconds = DORMANT_RECHECK_DAYS * 24 * 60 * 60
+    active_channels = [
+        channel for channel in channels
+        if not channel_catalog.is_dormant(channel['id'], start_ts, recheck_seconds)
+    ]
+    if len(active_channels) < len(channels):
+        print(f"投稿のないチャンネルを省略: {len(channels) - len(active_channels)}件")
+    return active_channels
+
+def get_target_channels(all_channels=None):
+    """指定された7つのチャンネルのみを取得（取得済みのチャンネル一覧があれば再利用）"""
     try:
-        all_channels = get_all_channels()
+        if all_channels is None:
+            all_channels = get_all_channels()
         
         # 指定された7つのチャンネルのみをフィルタリング
         target_channels = []
@@ -130,323 +244,921 @@ def get_target_channels():
 
 def is_bot_user(user_id):
     """ユーザーがbotかどうかを判定"""
-    try:
-        response = client.users_info(user=user_id)
-        if response['ok']:
-            user_info = response['user']
-            return user_info.get('is_bot', False) or user_info.get('name', '').startswith('bot')
-        return False
-    except Exception as e:
-        print(f"ユーザー情報取得エラー: {e}")
-        return False
+    return user_directory.is_bot(user_id)
 
-def get_user_name(user_id):
-    """ユーザーIDからユーザー名を取得"""
-    try:
-        response = client.users_info(user=user_id)
-        return response['user']['real_name'] or response['user']['display_name'] or response['user']['name']
-    except Exception as e:
-        print(f"ユーザー名取得エラー: {e}")
-        return user_id
+def new_channel_progress():
+    """チャンネルごとの取得状況（status: pending / ok / partial / failed / skipped）
 
-def get_messages_in_period(channel_id, start_time, end_time):
-    """指定期間内のメッセージを取得"""
-    messages = []
-    cursor = None
+    skippedはbotが参加していないなど読めないチャンネルで、再試行せず、取得失敗としても扱わない。
+    """
+    return {'status': 'pending', 'cursor': None, 'pages': 0, 'messages': 0, 'attempts': 0, 'synced': False, 'error': None}
+
+def iter_message_pages(channel_id, oldest_ts, latest_ts, progress=None):
+    """指定範囲のメッセージを1ページずつ返す（エラーはそのまま送出）
+
+    progressを渡すと、処理し終えたページの次のカーソルを記録し、
+    再度呼び出したときはそのカーソルから再開する。
+    """
+    cursor = progress['cursor'] if progress else None
     
     while True:
-        try:
-            # conversations_history APIを使用
-            response = client.conversations_history(
-                channel=channel_id,
-                oldest=str(int(start_time.timestamp())),
-                latest=str(int(end_time.timestamp())),
-                cursor=cursor,
-                limit=1000
-            )
-            
-            if not response['messages']:
-                break
-                
-            messages.extend(response['messages'])
-            
-            # ページネーション
-            if not response.get('has_more', False):
-                break
-            cursor = response.get('response_metadata', {}).get('next_cursor')
-            
-            # API制限を避けるため少し待機
-            time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"メッセージ取得エラー: {e}")
+        # conversations_history APIを使用
+        response = client.conversations_history(
+            channel=channel_id,
+            oldest=f"{oldest_ts:.6f}",
+            latest=f"{latest_ts:.6f}",
+            cursor=cursor,
+            limit=1000
+        )
+        
+        if not response['messages']:
             break
-    
-    return messages
+        
+        yield response['messages']
+        
+        # ページネーション
+        if not response.get('has_more', False):
+            break
+        cursor = response.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            break
+        # 呼び出し側がページを処理し終えてから再開位置を進める
+        if progress is not None:
+            progress['cursor'] = cursor
 
-def get_all_messages_from_all_channels(start_time, end_time):
-    """全てのチャンネルから指定期間内のメッセージを取得（個人ランキング用）"""
-    all_messages = []
-    all_channels = get_all_channels()
+def store_messages_in_range(channel_id, oldest_ts, latest_ts, track_progress=True):
+    """指定範囲のメッセージを取得し、1ページごとにローカル保存する"""
+    for page in iter_message_pages(channel_id, oldest_ts, latest_ts):
+        message_store.save_page(channel_id, page, track_progress)
+
+def sync_channel_to_store(channel_id, start_time, end_time):
+    """ローカル保存済みの範囲以降だけを取得して保存先に反映する（エラーはそのまま送出）
+
+    1ページごとに同期位置を保存しているため、失敗後に再度呼び出すと続きから再開する。
+    """
+    start_ts = start_time.timestamp()
+    end_ts = end_time.timestamp()
+    checkpoint = message_store.get_checkpoint(channel_id)
+    synced_from = checkpoint['synced_from']
+    synced_ts = checkpoint['synced_ts']
     
-    print(f"全チャンネルからSlackデータを取得中...")
-    print(f"期間: {start_time.strftime('%Y-%m-%d %H:%M:%S')} ～ {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"分析対象チャンネル数: {len(all_channels)}")
+    # 保存済みの範囲が期間とつながっていなければ、期間の先頭から取り直す
+    if synced_ts is None or synced_ts < start_ts:
+        synced_from, synced_ts = None, None
     
-    for i, channel in enumerate(all_channels, 1):
-        channel_id = channel['id']
-        channel_name = channel['name']
-        
-        print(f"[{i}/{len(all_channels)}] チャンネル: #{channel_name}")
-        
-        try:
-            messages = get_messages_in_period(channel_id, start_time, end_time)
-            if messages:
-                print(f"  → {len(messages)}件のメッセージを取得")
-                all_messages.extend(messages)
-            else:
-                print(f"  → メッセージなし")
-        except Exception as e:
-            print(f"  → エラー: {e}")
-            continue
-        
-        # API制限を避けるため少し待機
-        time.sleep(0.2)
+    # 前回中断した同期があれば、まだ取得していない古い側だけを取得して完了させる
+    if checkpoint['pending_latest'] is not None:
+        lower = synced_ts if synced_ts is not None else start_ts
+        if lower < checkpoint['pending_oldest']:
+            store_messages_in_range(channel_id, lower, checkpoint['pending_oldest'])
+        synced_from = synced_from if synced_from is not None else lower
+        synced_ts = checkpoint['pending_latest']
+        message_store.complete_sync(channel_id, synced_from, synced_ts)
     
-    print(f"総取得メッセージ数: {len(all_messages)}")
-    return all_messages
+    # 期間の先頭が保存済みの範囲より前なら、その部分を補う
+    if synced_from is not None and start_ts < synced_from:
+        store_messages_in_range(channel_id, start_ts, synced_from, track_progress=False)
+        synced_from = start_ts
+        message_store.complete_sync(channel_id, synced_from, synced_ts)
+    
+    # 前回の同期位置以降を取得（リアクション等の更新を拾うため少し重ねる）
+    if synced_ts is None:
+        lower = start_ts
+    else:
+        lower = max(start_ts, synced_ts - SYNC_OVERLAP_HOURS * 3600)
+    if lower < end_ts:
+        message_store.begin_sync(channel_id, end_ts)
+        store_messages_in_range(channel_id, lower, end_ts)
+        synced_from = synced_from if synced_from is not None else lower
+        message_store.complete_sync(channel_id, synced_from, max(end_ts, synced_ts or end_ts))
+
+def iter_channel_pages(channel_id, start_time, end_time, progress):
+    """期間内のメッセージを1ページずつ返す（ローカル保存先があれば差分同期してから保存先から読む）
 
-def get_messages_from_target_channels(start_time, end_time):
-    """指定された7つのチャンネルから指定期間内のメッセージを取得（チャンネル活動分析用）"""
-    all_messages = []
-    target_channels = get_target_channels()
+    progressに処理済みのページ数を記録し、失敗後に再度呼び出すと続きのページから返す。
+    """
+    start_ts = start_time.timestamp()
+    end_ts = end_time.timestamp()
     
-    print(f"指定チャンネルからSlackデータを取得中...")
+    if message_store:
+        if not progress['synced']:
+            try:
+                sync_channel_to_store(channel_id, start_time, end_time)
+            except Exception as e:
+                # 再試行の残っているうちは失敗として扱い、最後の試行では保存済みのデータで集計する
+                # （読めないチャンネルは保存済みのデータも使わない）
+                if progress['attempts'] <= CHANNEL_RETRY_ROUNDS or is_channel_access_error(e):
+                    raise
+                print(f"メッセージ同期エラー（保存済みのデータを使用）: {e}")
+                progress['error'] = str(e)
+            progress['synced'] = True
+        for i, page in enumerate(message_store.iter_messages(channel_id, start_ts, end_ts)):
+            if i >= progress['pages']:
+                yield page
+        return
+    
+    yield from iter_message_pages(channel_id, start_ts, end_ts, progress)
+
+def consume_channel(channel, start_time, end_time, consumer, progress=None):
+    """1チャンネル分のページを順にconsumerへ渡し、これまでに渡した件数を返す
+
+    失敗した場合はprogressに状況を記録してエラーを送出する（同じprogressで呼び直すと続きから再開）。
+    """
+    if progress is None:
+        progress = new_channel_progress()
+    progress['attempts'] += 1
+    progress['error'] = None
+    try:
+        for page in iter_channel_pages(channel['id'], start_time, end_time, progress):
+            consumer(channel, page)
+            progress['pages'] += 1
+            progress['messages'] += len(page)
+    except Exception as e:
+        if is_channel_access_error(e) and not progress['pages']:
+            # botが参加していないチャンネルなどは読めないため、再試行せずに省略する
+            progress['status'] = 'skipped'
+            progress['error'] = e.response.data['error']
+            return 0
+        progress['status'] = 'partial' if progress['pages'] else 'failed'
+        progress['error'] = str(e)
+        raise
+    # 同期に失敗して保存済みのデータだけで集計した場合は一部のみ
+    progress['status'] = 'partial' if progress['error'] else 'ok'
+    return progress['messages']
+
+def stream_channel_messages(channels, start_time, end_time, consumer, progress=None):
+    """チャンネルを並列に読み、取得したページをそのままconsumer(channel, page)に渡す
+
+    メッセージを溜め込まないため、メモリ使用量は同時に処理中のページ数で決まる。
+    失敗したチャンネルは最大CHANNEL_RETRY_ROUNDS回、取得済みのページの続きから再試行する。
+    progressに辞書を渡すと、チャンネルIDごとの取得状況（new_channel_progress()）を格納する。
+    """
     print(f"期間: {start_time.strftime('%Y-%m-%d %H:%M:%S')} ～ {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"分析対象チャンネル数: {len(target_channels)}")
+    print(f"分析対象チャンネル数: {len(channels)}")
     
-    for i, channel in enumerate(target_channels, 1):
-        channel_id = channel['id']
-        channel_name = channel['name']
-        
-        print(f"[{i}/{len(target_channels)}] チャンネル: #{channel_name}")
-        
-        try:
-            messages = get_messages_in_period(channel_id, start_time, end_time)
-            if messages:
-                print(f"  → {len(messages)}件のメッセージを取得")
-                all_messages.extend(messages)
-            else:
-                print(f"  → メッセージなし")
-        except Exception as e:
-            print(f"  → エラー: {e}")
-            continue
-        
-        # API制限を避けるため少し待機
-        time.sleep(0.2)
+    if progress is None:
+        progress = {}
+    for channel in channels:
+        progress.setdefault(channel['id'], new_channel_progress())
     
-    print(f"総取得メッセージ数: {len(all_messages)}")
-    return all_messages
-
-def analyze_reactions(messages):
-    """リアクションを分析（リアクションをした人を集計）"""
-    reaction_counts = Counter()
+    # API制限はclientのレートリミッターが管理するため、固定の待機は行わない
+    pending = list(channels)
+    for retry_round in range(CHANNEL_RETRY_ROUNDS + 1):
+        if retry_round:
+            delay = backoff_seconds(retry_round - 1)
+            print(f"取得に失敗した{len(pending)}チャンネルを{delay:.1f}秒後に再試行します（{retry_round}/{CHANNEL_RETRY_ROUNDS}）")
+            time.sleep(delay)
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, FETCH_WORKERS)) as executor:
+            futures = {
+                executor.submit(consume_channel, channel, start_time, end_time, consumer, progress[channel['id']]): channel
+                for channel in pending
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                channel = futures[future]
+                try:
+                    count = future.result()
+                except Exception as e:
+                    print(f"[{i}/{len(pending)}] チャンネル: #{channel['name']} → エラー: {e}")
+                    failed.append(channel)
+                    continue
+                if progress[channel['id']]['status'] == 'skipped':
+                    print(f"[{i}/{len(pending)}] チャンネル: #{channel['name']} → 読めないため省略"
+                          f"（{progress[channel['id']]['error']}）")
+                elif count:
+                    print(f"[{i}/{len(pending)}] チャンネル: #{channel['name']} → {count}件のメッセージを取得")
+                else:
+                    print(f"[{i}/{len(pending)}] チャンネル: #{channel['name']} → メッセージなし")
+        pending = failed
+        if not pending:
+            break
     
+    incomplete = [channel for channel in channels if progress[channel['id']]['status'] not in ('ok', 'skipped')]
+    if incomplete:
+        print(f"取得が完了しなかったチャンネル: {len(incomplete)}件（取得できた分だけ集計します）")
+    return sum(progress[channel['id']]['messages'] for channel in channels)
+
+def collect_thread_parents(channel_id, messages, thread_parents):
+    """返信のあるスレッドの親メッセージを (チャンネルID, thread_ts) → latest_reply で記録する"""
     for message in messages:
-        if 'reactions' in message:
-            for reaction in message['reactions']:
-                # 各リアクションのユーザーをカウント（リアクションをした人）
-                for user_id in reaction['users']:
-                    reaction_counts[user_id] += 1
-    
-    return reaction_counts
+        thread_ts = message.get('thread_ts')
+        if message.get('reply_count', 0) > 0 and thread_ts == message.get('ts'):
+            thread_parents[(channel_id, thread_ts)] = message.get('latest_reply')
+
+def get_thread_replies(channel_id, thread_ts, latest_reply):
+    """スレッドの返信を取得（親メッセージは除く）
 
-def analyze_reactions_received(messages):
-    """リアクションを受けた人を分析"""
-    reaction_received_counts = Counter()
+    ローカル保存先があり、前回からlatest_replyが変わっていなければ保存済みの返信を使う。
+    """
+    if message_store and latest_reply:
+        cached = message_store.get_thread(channel_id, thread_ts)
+        if cached and cached[0] == latest_reply:
+            return cached[1]
     
-    for message in messages:
-        if 'reactions' in message:
-            # メッセージの投稿者を取得
-            message_user = message.get('user')
-            if message_user:
-                # そのメッセージに付けられたリアクションの総数をカウント
-                total_reactions = sum(reaction['count'] for reaction in message['reactions'])
-                reaction_received_counts[message_user] += total_reactions
-    
-    return reaction_received_counts
-
-def analyze_channel_activity(start_time, end_time):
-    """チャンネル活動状況を分析"""
-    channel_stats = {}
-    target_channels = get_target_channels()
-    
-    for channel in target_channels:
-        channel_id = channel['id']
-        channel_name = channel['name']
-        
-        try:
-            messages = get_messages_in_period(channel_id, start_time, end_time)
-            
-            # 投稿数（bot除外）
-            post_count = 0
-            reply_count = 0
-            thread_count = 0
-            
-            for message in messages:
-                # botメッセージやシステムメッセージは除外
-                if message.get('subtype') in ['bot_message', 'system']:
-                    continue
-                
-                user_id = message.get('user')
-                if user_id and not is_bot_user(user_id):
-                    post_count += 1
-                
-                # スレッド返信をカウント
-                if message.get('thread_ts'):
-                    thread_count += 1
-                elif message.get('reply_count', 0) > 0:
-                    reply_count += message.get('reply_count', 0)
-            
-            channel_stats[channel_name] = {
-                'posts': post_count,
-                'replies': reply_count,
-                'threads': thread_count,
-                'total_activity': post_count + reply_count + thread_count
-            }
-            
-        except Exception as e:
-            print(f"チャンネル {channel_name} の分析エラー: {e}")
-            channel_stats[channel_name] = {
-                'posts': 0,
-                'replies': 0,
-                'threads': 0,
-                'total_activity': 0
-            }
+    replies = []
+    cursor = None
+    while True:
+        response = client.conversations_replies(
+            channel=channel_id,
+            ts=thread_ts,
+            cursor=cursor,
+            limit=200
+        )
+        for message in response['messages']:
+            # 親メッセージと、チャンネルにも投稿された返信（履歴側で集計済み）は除く
+            if message.get('ts') == thread_ts or message.get('subtype') == 'thread_broadcast':
+                continue
+            replies.append(message)
+        if not response.get('has_more', False):
+            break
+        cursor = response.get('response_metadata', {}).get('next_cursor')
+        if not cursor:
+            break
     
-    return channel_stats
+    if message_store and latest_reply:
+        message_store.save_thread(channel_id, thread_ts, latest_reply, replies)
+    return replies
 
-def analyze_posts(messages):
-    """投稿数を分析（bot除外）"""
-    post_counts = Counter()
+def stream_thread_replies(thread_parents, start_time, end_time, consumer):
+    """スレッドの返信を並列に取得し、期間内の返信をconsumer(channel_id, replies)に渡す"""
+    start_ts = start_time.timestamp()
+    end_ts = end_time.timestamp()
     
-    for message in messages:
-        # botメッセージやシステムメッセージは除外
-        if message.get('subtype') in ['bot_message', 'system']:
-            continue
-        
-        user_id = message.get('user')
-        if user_id:
-            # botユーザーかどうかをチェック
-            if is_bot_user(user_id):
+    total = 0
+    with ThreadPoolExecutor(max_workers=max(1, FETCH_WORKERS)) as executor:
+        futures = {
+            executor.submit(get_thread_replies, channel_id, thread_ts, latest_reply): channel_id
+            for (channel_id, thread_ts), latest_reply in thread_parents.items()
+        }
+        for future in as_completed(futures):
+            try:
+                replies = future.result()
+            except Exception as e:
+                print(f"スレッド返信取得エラー: {e}")
                 continue
-            post_counts[user_id] += 1
+            replies = [reply for reply in replies if start_ts < float(reply['ts']) <= end_ts]
+            if replies:
+                consumer(futures[future], replies)
+                total += len(replies)
     
-    return post_counts
+    return total
+
+def create_aggregator(sample_channel_ids=()):
+    """ANALYTICS_ENGINEに応じた集計エンジン（個人ランキング用）を作成
+
+    sketchエンジンのピックアップ投稿はsample_channel_idsのチャンネルからだけ選ぶ。
+    """
+    if ANALYTICS_ENGINE == 'columnar':
+        return ActivityColumns(is_bot_user)
+    if ANALYTICS_ENGINE == 'sketch':
+        return ActivitySketch(
+            is_bot_user, SKETCH_PRECISION, SKETCH_CAPACITY, SKETCH_SAMPLE_SIZE, sample_channel_ids
+        )
+    return ActivityAggregator(is_bot_user)
+
+def generate_ryuukuru_report(activity, channel_stats, comparison=None, incomplete_channels=None,
+                             heatmap_section=None, reaction_section=None, change_section=None,
+                             sketch_section=None, keyword_section=None):
+    """リュウクル風のレポートを生成
 
-def generate_ryuukuru_report(messages, channel_stats):
-    """リュウクル風のレポートを生成"""
+    activityは集計エンジンの集計結果、comparisonは前期間との比較、
+    incomplete_channelsは取得が完了しなかった (チャンネル, 取得状況) のリスト、
+    heatmap_sectionは活動が多い時間帯、reaction_sectionはリアクションのつながりのまとめ、
+    change_sectionは前期間のスナップショットからの順位の変化、
+    sketch_sectionは近似集計（sketchエンジン）の人数・誤差とピックアップ投稿、
+    keyword_sectionはキーワード索引から求めた話題のキーワードとツールの言及数。
+    """
     # 投稿数分析
-    post_counts = analyze_posts(messages)
+    top_posters = activity.top('posts', RANK_NUMBER)
     # リアクション分析（リアクションをした人）
-    reaction_given_counts = analyze_reactions(messages)
+    top_reaction_givers = activity.top('reactions_given', RANK_NUMBER)
     # リアクション分析（リアクションを受けた人）
-    reaction_received_counts = analyze_reactions_received(messages)
+    top_reaction_receivers = activity.top('reactions_received', RANK_NUMBER)
     
     # リュウクル風のレポート生成
     report = f"""リュウクル参上！
-今週のSlack活動をまとめてきたぞ。
+{PERIOD_LABEL}のSlack活動をまとめてきたぞ。
 
 ■ 集計期間: {START_JST.strftime('%Y年%m月%d日')} ～ {END_JST.strftime('%Y年%m月%d日')}
 ■ 実行時刻: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}
 
-今週はこんな感じだった！
+{PERIOD_LABEL}はこんな感じだった！
 
 1. 投稿数ランキング"""
     
-    # 投稿数ランキング（上位3位）
-    if post_counts:
-        for i, (user_id, count) in enumerate(post_counts.most_common(3), 1):
+    # 投稿数ランキング（上位RANK_NUMBER位）
+    if top_posters:
+        for i, (user_id, count) in enumerate(top_posters, 1):
             report += f"\n　{i}位 <@{user_id}>：{count}件"
     else:
         report += "\n　投稿データなし"
     
     report += "\n\n2. リアクションを多くした人（アクティブ度）"
     
-    # リアクションをした人ランキング（上位3位）
-    if reaction_given_counts:
-        for i, (user_id, count) in enumerate(reaction_given_counts.most_common(3), 1):
+    # リアクションをした人ランキング（上位RANK_NUMBER位）
+    if top_reaction_givers:
+        for i, (user_id, count) in enumerate(top_reaction_givers, 1):
             report += f"\n　{i}位 <@{user_id}>：{count}回のリアクション！"
     else:
         report += "\n　リアクションデータなし"
     
     report += "\n\n3. リアクションを多く受けた人（有益度）"
     
-    # リアクションを受けた人ランキング（上位3位）
-    if reaction_received_counts:
-        for i, (user_id, count) in enumerate(reaction_received_counts.most_common(3), 1):
+    # リアクションを受けた人ランキング（上位RANK_NUMBER位）
+    if top_reaction_receivers:
+        for i, (user_id, count) in enumerate(top_reaction_receivers, 1):
             report += f"\n　{i}位 <@{user_id}>：{count}回のリアクション獲得！"
     else:
         report += "\n　リアクションデータなし"
     
     report += "\n\n4. チャンネル活動状況ランキング"
     
-    # チャンネル活動ランキング（上位3位）
+    # チャンネル活動ランキング（上位RANK_NUMBER位）
     if channel_stats:
         sorted_channels = sorted(channel_stats.items(), key=lambda x: x[1]['total_activity'], reverse=True)
-        for i, (channel_name, stats) in enumerate(sorted_channels[:3], 1):
-            report += f"\n　{i}位 #{channel_name}：{stats['total_activity']}件（投稿:{stats['posts']}件、返信:{stats['replies']}件、スレッド:{stats['threads']}件）"
+        for i, (channel_name, stats) in enumerate(sorted_channels[:RANK_NUMBER], 1):
+            report += (f"\n　{i}位 #{channel_name}：{stats['total_activity']}件（投稿:{stats['posts']}件、返信:{stats['replies']}件、"
+                       f"スレッド:{stats['threads']}件、参加:{stats['unique_posters']}人）")
     else:
         report += "\n　チャンネル活動データなし"
     
+    if comparison:
+        report += f"\n\n{comparison}"
+    
+    if change_section:
+        report += f"\n\n{change_section}"
+    
+    if keyword_section:
+        report += f"\n\n{keyword_section}"
+    
+    if heatmap_section:
+        report += f"\n\n{heatmap_section}"
+    
+    if reaction_section:
+        report += f"\n\n{reaction_section}"
+    
+    if sketch_section:
+        report += f"\n\n{sketch_section}"
+    
+    if incomplete_channels:
+        names = [
+            f"#{channel['name']}（{'一部のみ' if status['status'] == 'partial' else '取得失敗'}）"
+            for channel, status in incomplete_channels
+        ]
+        report += f"\n\n※ 次のチャンネルは取得が完了しなかったため、取得できた分だけ集計しているぞ: {'、'.join(names)}"
+    
     report += f"""
 
-これで今週のSlack活動は一目瞭然だな。
+これで{PERIOD_LABEL}のSlack活動は一目瞭然だな。
 来週もオイラが集計して報告するから、楽しみにしててくれよ！"""
     
     return report
 
-def main():
+def format_change(current, previous, unit):
+    """前期間からの増減を「+5件、+12.5%」の形式で返す"""
+    diff = current - previous
+    if previous:
+        return f"{diff:+d}{unit}、{diff / previous * 100:+.1f}%"
+    return f"{diff:+d}{unit}"
+
+def generate_comparison_section(current, previous, channel_stats, previous_channel_stats):
+    """前期間との比較セクションを生成（どちらもロールアップから合算した集計結果）"""
+    def label(activity):
+        first = datetime.strptime(activity.first_day, '%Y-%m-%d')
+        last = datetime.strptime(activity.last_day, '%Y-%m-%d')
+        return f"{first.strftime('%Y年%m月%d日')} ～ {last.strftime('%Y年%m月%d日')}"
+    section = f"5. 前期間との比較（{label(current)}と{label(previous)}の比較）"
+    for metric, name, unit in [
+        ('posts', '投稿数', '件'),
+        ('reactions_given', 'リアクション数', '回'),
+    ]:
+        now_total = current.total(metric)
+        before_total = previous.total(metric)
+        section += f"\n　{name}：{now_total}{unit}（{format_change(now_total, before_total, unit)}）"
+    
+    sorted_channels = sorted(channel_stats.items(), key=lambda x: x[1]['total_activity'], reverse=True)
+    for channel_name, stats in sorted_channels[:RANK_NUMBER]:
+        before = previous_channel_stats.get(channel_name, {}).get('total_activity', 0)
+        section += f"\n　#{channel_name}：{stats['total_activity']}件（{format_change(stats['total_activity'], before, '件')}）"
+    
+    return section
+
+# 日別に保存する集計（期間の最初の日は0時から、実行日のように途中で終わる日は保存しない）
+DAILY_COLLECTORS = ('rollups', 'terms')
+
+# スナップショットに保存する集計（to_state()／merge_state()を持つもの）
+SNAPSHOT_COLLECTORS = ('activity', 'channels', 'heatmap', 'reactions')
+
+def create_collectors(target_channels, mergeable=False, bot_ids=None):
+    """同じ走査の中で一緒に更新する集計（ROLLUP_PATH設定時は日別集計も）を作成
+
+    どれもActivityAggregatorと同じadd(messages, channel_id, is_reply)を持つ。
+    個人ランキングは全チャンネル、チャンネル活動状況は指定された7つのチャンネルを集計する。
+    mergeable=Trueならスナップショットを足し合わせられる集計エンジン（stream / sketch）を使う。
+    sketchエンジンでは参加人数もHyperLogLogで推定し、ユーザーの組の数だけ大きくなる
+    リアクションのつながりは集計しない。
+    """
+    if bot_ids is None:
+        bot_ids = user_directory.bot_ids()
+    sketch = ANALYTICS_ENGINE == 'sketch'
+    # 本文を載せるピックアップ投稿は、プライベートチャンネルを除いた指定チャンネルから選ぶ
+    public_channel_ids = [channel['id'] for channel in target_channels if not channel.get('is_private')]
+    collectors = {
+        'activity': (
+            ActivityAggregator(is_bot_user) if mergeable and not sketch else create_aggregator(public_channel_ids)
+        ),
+        'channels': ChannelActivity(
+            bot_ids, [channel['id'] for channel in target_channels], SKETCH_PRECISION if sketch else None,
+            fetched_replies=INCLUDE_THREAD_REPLIES
+        ),
+        'heatmap': ActivityHeatmap(is_bot_user),
+    }
+    if not sketch:
+        collectors['reactions'] = ReactionGraph()
+    if rollup_store:
+        collectors['rollups'] = RollupBuilder(is_bot_user, fetched_replies=INCLUDE_THREAD_REPLIES)
+    if term_index:
+        collectors['terms'] = TermIndexBuilder(is_bot_user, [channel['id'] for channel in target_channels])
+    return collectors
+
+def merge_snapshot_states(collectors, states):
+    """スナップショットに保存したチャンネルの集計を足し合わせる"""
+    for name in SNAPSHOT_COLLECTORS:
+        if name in collectors:
+            collectors[name].merge_state(states[name])
+
+def collection_start(collectors):
+    """履歴を取得する開始時刻
+
+    日別に保存する集計（DAILY_COLLECTORS）があれば、期間の最初の日も1日分そろうよう、その日の0時から取得する。
+    """
+    if any(name in collectors for name in DAILY_COLLECTORS):
+        return day_start(START_JST)
+    return START_JST
+
+def saved_day_range():
+    """期間のうち日別に保存される日付（YYYY-MM-DD）の最初と最後
+
+    実行日のように途中で終わる日は保存しないため、丸1日分そろった最後の日までとする。
+    """
+    return day_range(START_JST, END_JST)[0], last_full_day(END_JST)
+
+def add_to_collectors(collectors, messages, channel_id, is_reply=False):
+    """1ページ分のメッセージを全ての集計に加える
+
+    期間の開始（START_JST）より前のメッセージは、日別に保存する集計（DAILY_COLLECTORS）にだけ加える。
+    """
+    start_ts = START_JST.timestamp()
+    in_period = [message for message in messages if float(message['ts']) > start_ts]
+    with telemetry.stage('aggregation'):
+        for name, collector in collectors.items():
+            batch = messages if name in DAILY_COLLECTORS else in_period
+            if batch:
+                collector.add(batch, channel_id, is_reply=is_reply)
+
+def save_rollups(collectors, incomplete_channels):
+    """日別集計を保存する（ROLLUP_PATH未設定なら何もしない）"""
+    rollup_builder = collectors.get('rollups')
+    if not rollup_builder:
+        return
+    # 一部しか取得できなかったチャンネルで保存済みの日別集計を上書きしない
+    rollup_builder.discard([channel['id'] for channel, _ in incomplete_channels])
+    with telemetry.stage('rollup_save'):
+        saved_days = rollup_store.save(
+            rollup_builder, first_full_day(collection_start(collectors)), last_full_day(END_JST)
+        )
+    print(f"日別集計を保存: {saved_days}日分")
+
+def save_term_index(collectors, incomplete_channels):
+    """キーワード索引に日別の単語の出現数を保存する（TERM_INDEX_PATH未設定なら何もしない）"""
+    term_builder = collectors.get('terms')
+    if not term_builder:
+        return
+    # 一部しか取得できなかったチャンネルで保存済みの出現数を上書きしない
+    term_builder.discard([channel['id'] for channel, _ in incomplete_channels])
+    with telemetry.stage('term_index_save'):
+        saved_days = term_index.save(
+            term_builder, first_full_day(collection_start(collectors)), last_full_day(END_JST)
+        )
+    print(f"キーワード索引を保存: {saved_days}日分")
+
+@functools.lru_cache(maxsize=None)
+def workspace_id():
+    """スナップショットのキーに使うワークスペースID（取得できなければ空文字）"""
     try:
-        # 個人ランキング用：全チャンネルから期間内のメッセージを取得
-        all_messages = get_all_messages_from_all_channels(START_JST, END_JST)
+        return client.auth_test()['team_id']
+    except Exception as e:
+        print(f"ワークスペース情報取得エラー: {e}")
+        return ''
+
+def get_snapshot_key(start_time, end_time, all_channels, target_channels):
+    """期間（JSTの日付）・チャンネル構成・集計設定からスナップショットのキーを求める"""
+    return snapshot_key(
+        workspace_id(), *day_range(start_time, end_time),
+        [channel['id'] for channel in all_channels], [channel['id'] for channel in target_channels],
+        INCLUDE_THREAD_REPLIES, 'sketch' if ANALYTICS_ENGINE == 'sketch' else 'stream'
+    )
+
+def get_latest_ts(channel_id, start_time, end_time):
+    """期間内の最新のメッセージの時刻を返す（メッセージがなければNone）"""
+    response = client.conversations_history(
+        channel=channel_id,
+        oldest=f"{start_time.timestamp():.6f}",
+        latest=f"{end_time.timestamp():.6f}",
+        limit=1
+    )
+    return float(response['messages'][0]['ts']) if response['messages'] else None
+
+def reuse_snapshot(snapshot, channels, collectors):
+    """期間内の最新の投稿が変わっていないチャンネルはスナップショットの集計をcollectorsに足し合わせる
+
+    取得し直す必要のあるチャンネルのリストを返す（最新の投稿の確認は1チャンネル1回の呼び出し）。
+    """
+    candidates = [channel for channel in channels if channel['id'] in snapshot['channels']]
+    if not candidates:
+        return channels
+    latest_ts = {}
+    with ThreadPoolExecutor(max_workers=max(1, FETCH_WORKERS)) as executor:
+        futures = {
+            executor.submit(get_latest_ts, channel['id'], START_JST, END_JST): channel for channel in candidates
+        }
+        for future in as_completed(futures):
+            try:
+                latest_ts[futures[future]['id']] = future.result()
+            except Exception as e:
+                print(f"最新メッセージ確認エラー（#{futures[future]['name']}）: {e}")
+    
+    pending = []
+    for channel in channels:
+        entry = snapshot['channels'].get(channel['id'])
+        if channel['id'] in latest_ts and snapshot_store.is_reusable(
+            entry, latest_ts[channel['id']], START_JST.timestamp(), END_JST.timestamp()
+        ):
+            merge_snapshot_states(collectors, entry['states'])
+        else:
+            pending.append(channel)
+    print(f"スナップショットを再利用: {len(channels) - len(pending)}チャンネル（取得し直すチャンネル: {len(pending)}件）")
+    return pending
+
+def load_previous_collectors(all_channels, target_channels):
+    """前期間（同じ長さ）のスナップショットを集計に戻す（なければNone。Slackからは取得しない）"""
+    previous_end = START_JST - timedelta(seconds=1)
+    previous_start = previous_end - (END_JST - START_JST)
+    snapshot = snapshot_store.load(get_snapshot_key(previous_start, previous_end, all_channels, target_channels))
+    if not snapshot or not snapshot['channels']:
+        return None
+    collectors = create_collectors(target_channels, mergeable=True)
+    for entry in snapshot['channels'].values():
+        merge_snapshot_states(collectors, entry['states'])
+    return collectors
+
+def generate_change_section(current, previous, target_channels):
+    """前期間のスナップショットと比べた順位の変化のセクションを生成（前期間のメッセージは再取得しない）"""
+    section = "■ 前期間からの順位の変化"
+    
+    current_posts = current['activity'].top('posts', RANK_NUMBER)
+    previous_posts = previous['activity'].top('posts', len(previous['activity'].post_counts))
+    changes = ranking_changes(current_posts, previous_posts)
+    for rank, (user_id, count) in enumerate(current_posts, 1):
+        previous_rank, previous_count = changes[user_id]
+        section += (f"\n　投稿数{rank}位 <@{user_id}>（{format_rank_move(rank, previous_rank)}）："
+                    f"{count}件（{format_change(count, previous_count, '件')}）")
+    
+    def channel_ranking(collectors):
+        stats = collectors['channels'].channel_stats(target_channels)
+        return sorted(((name, s['total_activity']) for name, s in stats.items()), key=lambda item: -item[1])
+    
+    current_channels = channel_ranking(current)[:RANK_NUMBER]
+    changes = ranking_changes(current_channels, channel_ranking(previous))
+    for rank, (channel_name, total) in enumerate(current_channels, 1):
+        previous_rank, previous_total = changes[channel_name]
+        section += (f"\n　チャンネル{rank}位 #{channel_name}（{format_rank_move(rank, previous_rank)}）："
+                    f"{total}件（{format_change(total, previous_total, '件')}）")
+    return section
+
+def generate_keyword_section(target_channels, n=5):
+    """キーワード索引から、話題のキーワードとツールの言及数の前期間比のセクションを生成
+
+    どちらも保存済みの日別の出現数を合算する（前期間のメッセージは再取得しない）。
+    今期間は保存済みの日（saved_day_range()）だけとし、前期間も同じ日数にする。
+    """
+    current_days = saved_day_range()
+    previous_days = previous_day_range(*current_days)
+    channel_ids = [channel['id'] for channel in target_channels]
+    with telemetry.stage('keyword_trends'):
+        keywords = term_index.trending(current_days, previous_days, n, channel_ids=channel_ids)
+        mentions = [mention for mention in term_index.tool_mentions(current_days, previous_days, channel_ids)
+                    if mention[1]][:n]
+        has_previous = term_index.has_days(*previous_days)
+    if not keywords and not mentions:
+        return None
+    
+    def describe(count, previous_count):
+        if not has_previous:
+            return f"{count}件"
+        return f"{count}件（{format_change(count, previous_count, '件')}）"
+    
+    section = "■ 話題のキーワード（指定チャンネルの投稿に出てきた数）"
+    if keywords:
+        section += "\n　" + "、".join(f"「{term}」{describe(count, before)}" for term, count, before in keywords)
+    if mentions:
+        section += "\n　ツールの言及：" + "、".join(f"{name} {describe(count, before)}" for name, count, before in mentions)
+    return section
+
+def collect_activity(all_channels, target_channels):
+    """全チャンネルの履歴を取得しながら集計する（ROLLUP_PATH設定時は日別集計も保存）
+
+    集計（create_collectors()）と、取得が完了しなかったチャンネルの (チャンネル, 取得状況) のリストを返す。
+    REPORT_SNAPSHOT_DIR設定時は、チャンネルごとに集計してスナップショットに保存し、
+    前回から変わっていないチャンネルは取得せずにスナップショットの集計を使う。
+    """
+    with telemetry.stage('user_lookups'):
+        user_directory.prefetch()
+    bot_ids = user_directory.bot_ids()
+    
+    # 取得したページごとに全ての集計を同時に更新する（メッセージ全体はメモリに保持しない）
+    collectors = create_collectors(target_channels, mergeable=bool(snapshot_store), bot_ids=bot_ids)
+    thread_parents = {}
+    latest_ts = {}
+    oldest_ts = {}
+    progress = {}
+    # ROLLUP_PATH設定時は期間の最初の日の0時から取得する（期間より前の分は日別集計にだけ加える）
+    fetch_start = collection_start(collectors)
+    
+    channels = skip_dormant_channels(all_channels, fetch_start)
+    snapshot = None
+    channel_collectors = {}
+    if snapshot_store:
+        key = get_snapshot_key(START_JST, END_JST, all_channels, target_channels)
+        snapshot = snapshot_store.load(key) or new_snapshot(key)
+        with telemetry.stage('snapshot_check'):
+            channels = reuse_snapshot(snapshot, channels, collectors)
+        # 取得するチャンネルはチャンネルごとに集計し、あとで足し合わせる（日別集計・キーワード索引は共通）
+        for channel in channels:
+            channel_collectors[channel['id']] = {
+                **create_collectors(target_channels, mergeable=True, bot_ids=bot_ids),
+                **{name: collectors[name] for name in DAILY_COLLECTORS if name in collectors},
+            }
+    
+    def consume_page(channel, page):
+        # 最新・最古の時刻は期間内のメッセージで記録する（スナップショットの再利用の判定に使う）
+        page_ts = [float(m['ts']) for m in page if float(m['ts']) > START_JST.timestamp()]
+        if page_ts:
+            latest_ts[channel['id']] = max(latest_ts.get(channel['id'], 0), max(page_ts))
+            oldest_ts[channel['id']] = min(oldest_ts.get(channel['id'], float('inf')), min(page_ts))
+        add_to_collectors(channel_collectors.get(channel['id'], collectors), page, channel['id'])
+        if INCLUDE_THREAD_REPLIES:
+            collect_thread_parents(channel['id'], page, thread_parents)
+    
+    def consume_replies(channel_id, replies):
+        add_to_collectors(channel_collectors.get(channel_id, collectors), replies, channel_id, is_reply=True)
+    
+    print(f"全チャンネルからSlackデータを取得中...")
+    with telemetry.stage('history_fetch'):
+        stream_channel_messages(channels, fetch_start, END_JST, consume_page, progress)
+    incomplete_channels = [
+        (channel, progress[channel['id']]) for channel in channels
+        if progress[channel['id']]['status'] not in ('ok', 'skipped')
+    ]
+    
+    # 次回以降、投稿のないチャンネルを判定できるよう最新メッセージの時刻を記録
+    # （取得が完了しなかったチャンネルと、現在時刻までではない過去の期間は記録しない）
+    if PERIOD_ENDS_NOW:
+        for channel in channels:
+            if progress[channel['id']]['status'] == 'ok':
+                channel_catalog.record_activity(
+                    channel['id'], latest_ts.get(channel['id']), START_JST.timestamp(), END_JST.timestamp()
+                )
+        channel_catalog.save()
+    
+    # スレッド返信も投稿・リアクションの集計に含める
+    if thread_parents:
+        print(f"スレッド返信を取得中...（{len(thread_parents)}スレッド）")
+        with telemetry.stage('thread_replies'):
+            reply_total = stream_thread_replies(thread_parents, fetch_start, END_JST, consume_replies)
+        print(f"取得したスレッド返信数: {reply_total}")
+    
+    if snapshot is not None:
+        # 取得が完了したチャンネルだけをスナップショットに保存する（一部のみのチャンネルも集計には含める）
+        for channel in channels:
+            states = {
+                name: collector.to_state() for name, collector in channel_collectors[channel['id']].items()
+                if name in SNAPSHOT_COLLECTORS
+            }
+            merge_snapshot_states(collectors, states)
+            if progress[channel['id']]['status'] == 'ok':
+                snapshot_store.record(
+                    snapshot, channel['id'], START_JST.timestamp(), END_JST.timestamp(),
+                    latest_ts.get(channel['id']), oldest_ts.get(channel['id']), states
+                )
+        with telemetry.stage('snapshot_save'):
+            snapshot_store.save(snapshot)
+    print(f"総取得メッセージ数: {collectors['activity'].message_count}")
+    
+    save_rollups(collectors, incomplete_channels)
+    save_term_index(collectors, incomplete_channels)
+    
+    return collectors, incomplete_channels
+
+def record_export_sync(channels, covered_ts):
+    """エクスポートから保存したチャンネルの同期済みの範囲を広げる
+
+    covered_tsはエクスポートに含まれる最新のメッセージの時刻（エクスポートはこの時刻まで揃っている）。
+    保存済みの範囲と重ならないチャンネルは、範囲が飛び飛びにならないよう同期済みとして記録しない。
+    """
+    start_ts = START_JST.timestamp()
+    end_ts = min(END_JST.timestamp(), covered_ts)
+    for channel in channels:
+        checkpoint = message_store.get_checkpoint(channel['id'])
+        if checkpoint['pending_latest'] is not None:
+            continue
+        synced_from, synced_ts = checkpoint['synced_from'], checkpoint['synced_ts']
+        if synced_ts is None:
+            message_store.complete_sync(channel['id'], start_ts, end_ts)
+        elif start_ts <= synced_ts and synced_from <= end_ts:
+            message_store.complete_sync(channel['id'], min(start_ts, synced_from), max(end_ts, synced_ts))
+
+def collect_export_activity(export, all_channels, target_channels):
+    """Slackのエクスポート（ZIP）から集計する（APIは呼ばない。戻り値はcollect_activity()と同じ）
+
+    日別ファイルをEXPORT_WORKERS個のプロセスで読み込み、APIから取得したときと同じ集計に渡す。
+    MESSAGE_STORE_PATH設定時は読み込んだメッセージをローカル保存先にも保存し、
+    ROLLUP_PATH設定時は日別集計も保存する（過去の期間をまとめて取り込める）。
+    """
+    collectors = create_collectors(target_channels)
+    covered_ts = 0
+    file_count = 0
+    
+    print(f"エクスポートからSlackデータを読み込み中...（{export.path}）")
+    with telemetry.stage('export_ingest'):
+        for channel, posts, replies in export.iter_pages(
+            all_channels, collection_start(collectors), END_JST, EXPORT_WORKERS, INCLUDE_THREAD_REPLIES
+        ):
+            file_count += 1
+            for messages, is_reply in [(posts, False), (replies, True)]:
+                if not messages:
+                    continue
+                covered_ts = max(covered_ts, max(float(m['ts']) for m in messages))
+                add_to_collectors(collectors, messages, channel['id'], is_reply=is_reply)
+            if message_store:
+                message_store.save_page(channel['id'], posts, track_progress=False)
+    print(f"読み込んだ日別ファイル数: {file_count}")
+    print(f"総取得メッセージ数: {collectors['activity'].message_count}")
+    
+    if message_store and covered_ts:
+        record_export_sync(all_channels, covered_ts)
+        print(f"ローカル保存先に保存しました: {MESSAGE_STORE_PATH}")
+    
+    save_rollups(collectors, [])
+    save_term_index(collectors, [])
+    
+    return collectors, []
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Slackの活動状況を集計してリュウクル風のレポートを作成する")
+    parser.add_argument('--period', choices=sorted(PERIODS), default='week',
+                        help="集計期間（week: 直近7日、month: 直近30日）")
+    parser.add_argument('--days', type=int, help="直近N日を集計（--periodより優先）")
+    parser.add_argument('--start', help="集計開始日（YYYY-MM-DD、JST）")
+    parser.add_argument('--end', help="集計終了日（YYYY-MM-DD、JST。省略時は現在まで）")
+    parser.add_argument('--from-rollups', action='store_true',
+                        help="Slackから取得せず、保存済みの日別集計（ROLLUP_PATH）を合算してレポートを作成")
+    parser.add_argument('--export', metavar='ZIP',
+                        help="Slackから取得せず、ワークスペースのエクスポート（ZIP）から集計（APIは呼ばない）")
+    parser.add_argument('--compare', action='store_true',
+                        help="直前の同じ長さの期間との比較を追加（ROLLUP_PATHが必要）")
+    args = parser.parse_args(argv)
+    if (args.from_rollups or args.compare) and not rollup_store:
+        parser.error("--from-rollups / --compare には環境変数ROLLUP_PATHの設定が必要です")
+    if args.from_rollups and args.export:
+        parser.error("--from-rollups と --export は同時に指定できません")
+    if args.end and not args.start:
+        parser.error("--end を指定する場合は --start も指定してください")
+    return args
+
+def resolve_period(args):
+    """コマンドライン引数から (開始時刻, 終了時刻, 期間の呼び方, 現在時刻までの期間か) を求める"""
+    now = datetime.now(JST)
+    if args.start:
+        start_time = JST.localize(datetime.strptime(args.start, '%Y-%m-%d'))
+        if args.end:
+            end_time = JST.localize(datetime.strptime(args.end, '%Y-%m-%d') + timedelta(days=1)) - timedelta(seconds=1)
+        else:
+            end_time = now
+        return start_time, min(end_time, now), "この期間", end_time >= now
+    if args.days:
+        return now - timedelta(days=args.days), now, f"直近{args.days}日", True
+    days, label = PERIODS[args.period]
+    return now - timedelta(days=days), now, label, True
+
+def main(argv=None):
+    """集計してレポートを作成し、REPORT_PATHに保存する（作成したレポートの本文を返す）"""
+    global START_JST, END_JST, PERIOD_LABEL, PERIOD_ENDS_NOW
+    args = parse_args(argv)
+    START_JST, END_JST, PERIOD_LABEL, PERIOD_ENDS_NOW = resolve_period(args)
+    
+    try:
+        export = None
+        if args.export:
+            # チャンネル一覧・ユーザー一覧もエクスポートに含まれるものを使う
+            export = SlackExport(args.export)
+            user_directory.load_members(export.members)
+        # チャンネル一覧は1回だけ取得し、各チャンネルの履歴も1回だけ取得する
+        with telemetry.stage('channel_listing'):
+            all_channels = export.list_channels() if export else get_all_channels()
+            target_channels = get_target_channels(all_channels)
         
-        # チャンネル活動状況を分析（指定された7つのチャンネルのみ）
-        channel_stats = analyze_channel_activity(START_JST, END_JST)
+        if args.from_rollups:
+            # 保存済みの日別集計を合算する（Slackからは取得しない）
+            activity = rollup_store.activity(*saved_day_range())
+            collectors = {'activity': activity, 'channels': activity}
+            incomplete_channels = []
+            print(f"日別集計から集計: {activity.message_count}件のメッセージ")
+        else:
+            if export:
+                collectors, incomplete_channels = collect_export_activity(export, all_channels, target_channels)
+            else:
+                collectors, incomplete_channels = collect_activity(all_channels, target_channels)
+            activity = collectors['activity']
+        heatmap = collectors.get('heatmap')
+        reaction_graph = collectors.get('reactions')
+        with telemetry.stage('channel_stats'):
+            channel_stats = collectors['channels'].channel_stats(target_channels)
         
-        if not all_messages:
+        if not activity.message_count:
             print(f"指定期間内にメッセージが見つかりませんでした。")
             # エラー時でもレポートファイルを作成
             error_report = f"""リュウクル参上！
-今週のSlack活動をまとめてきたぞ。
+{PERIOD_LABEL}のSlack活動をまとめてきたぞ。
 
 ■ 集計期間: {START_JST.strftime('%Y年%m月%d日')} ～ {END_JST.strftime('%Y年%m月%d日')}
 ■ 実行時刻: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}
 
-申し訳ないが、今週はデータが取得できなかったぞ。
+申し訳ないが、{PERIOD_LABEL}はデータが取得できなかったぞ。
 Slack Appの権限設定を確認してくれ！
 
 来週はきっと正常に集計できるはずだ！"""
             
-            with open('weekly_report.txt', 'w', encoding='utf-8') as f:
+            with open(REPORT_PATH, 'w', encoding='utf-8') as f:
                 f.write(error_report)
-            return
+            return error_report
         
         # リュウクル風レポート生成（個人ランキングは全チャンネル、チャンネル活動は指定チャンネル）
-        report = generate_ryuukuru_report(all_messages, channel_stats)
+        comparison = None
+        if args.compare:
+            # 今期間・前期間とも日別集計を日単位で合算する（前期間のメッセージは再取得しない）
+            # 実行日は保存されないため、今期間・前期間とも保存済みの日数でそろえる
+            first_day, last_day = saved_day_range()
+            current = rollup_store.activity(first_day, last_day)
+            previous = rollup_store.activity(*previous_day_range(first_day, last_day))
+            comparison = generate_comparison_section(
+                current, previous,
+                current.channel_stats(target_channels), previous.channel_stats(target_channels)
+            )
+        # 曜日×時間帯のまとめ（日別集計には時刻がないため、Slackから取得したときだけ）
+        heatmap_section = None
+        if heatmap:
+            heatmap_section = heatmap.summary_section(target_channels)
+            if HEATMAP_PATH:
+                heatmap.save(HEATMAP_PATH, all_channels)
+                print(f"ヒートマップを保存: {HEATMAP_PATH}")
+        # リアクションの「誰が誰に」のまとめ（日別集計には送り手と受け手の組がないため、Slackから取得したときだけ）
+        reaction_section = None
+        if reaction_graph:
+            with telemetry.stage('reaction_graph'):
+                reaction_section = reaction_graph.summary_section(RANK_NUMBER)
+                if REACTION_GRAPH_PATH:
+                    reaction_graph.save(REACTION_GRAPH_PATH, RANK_NUMBER)
+                    print(f"リアクションの集計を保存: {REACTION_GRAPH_PATH}")
+        # 前期間のスナップショットがあれば順位の変化を載せる（前期間のメッセージは再取得しない）
+        change_section = None
+        if snapshot_store and not args.from_rollups and not export:
+            previous = load_previous_collectors(all_channels, target_channels)
+            if previous:
+                change_section = generate_change_section(collectors, previous, target_channels)
+        # 話題のキーワード（キーワード索引に保存済みの日別の出現数から求める）
+        keyword_section = generate_keyword_section(target_channels) if term_index else None
+        # 近似集計の人数・誤差（sketchエンジンのときだけ）
+        sketch_section = activity.summary_section() if isinstance(activity, ActivitySketch) else None
+        with telemetry.stage('report'):
+            report = generate_ryuukuru_report(
+                activity, channel_stats, comparison, incomplete_channels, heatmap_section, reaction_section,
+                change_section, sketch_section, keyword_section
+            )
         
         # 結果表示
         print(report)
         
         # レポートをファイルに保存（send_dm.pyで使用）
-        with open('weekly_report.txt', 'w', encoding='utf-8') as f:
+        with open(REPORT_PATH, 'w', encoding='utf-8') as f:
             f.write(report)
+        return report
             
     except Exception as e:
         print(f"エラーが発生しました: {e}")
         # エラー時でもレポートファイルを作成
         error_report = f"""リュウクル参上！
-今週のSlack活動をまとめてきたぞ。
+{PERIOD_LABEL}のSlack活動をまとめてきたぞ。
 
 ■ 集計期間: {START_JST.strftime('%Y年%m月%d日')} ～ {END_JST.strftime('%Y年%m月%d日')}
 ■ 実行時刻: {datetime.now().strftime('%Y年%m月%d日 %H:%M')}
@@ -458,8 +1170,34 @@ Slack Appの権限設定を確認してくれ！
 
 来週はきっと正常に集計できるはずだ！"""
         
-        with open('weekly_report.txt', 'w', encoding='utf-8') as f:
+        with open(REPORT_PATH, 'w', encoding='utf-8') as f:
             f.write(error_report)
+        return error_report
+
+def report_key(report):
+    """投稿済みの記録に使うレポートのキー
+
+    期間と本文のハッシュ（実行時刻の行は除く）から作るため、同じ内容のレポートを再実行しても二重投稿せず、
+    エラーのレポートを投稿した後の再実行では、作り直したレポートを改めて投稿する。
+    """
+    return f"{REPORT_PATH}:{START_JST.strftime('%Y-%m-%d')}:{END_JST.strftime('%Y-%m-%d')}:{report_digest(report)}"
+
+def run_with_metrics(argv=None):
+    """main()を実行し、計測結果をレポートと同じ場所に保存する（PROFILE_PATH設定時はプロファイルも保存）"""
+    try:
+        if PROFILE_PATH:
+            import cProfile
+            profiler = cProfile.Profile()
+            report = profiler.runcall(main, argv)
+            profiler.dump_stats(PROFILE_PATH)
+            print(f"プロファイルを保存: {PROFILE_PATH}")
+        else:
+            report = main(argv)
+    finally:
+        if METRICS_PATH:
+            telemetry.write(METRICS_PATH, METRICS_FORMAT)
+            print(f"計測結果を保存: {METRICS_PATH}")
+    return report
 
 if __name__ == "__main__":
-    main()
+    run_with_metrics()
@@ -1,48 +1,72 @@
 import os
-import json
-from slack_sdk.web import WebClient
-from datetime import datetime, timedelta
-import pytz
 
-def send_report_to_channel():
+# 投稿済みのメッセージの記録先（同じレポートを再実行しても二重投稿しない）
+DELIVERY_LOG_PATH = os.getenv('DELIVERY_LOG_PATH', '.slack-cache/delivery_log.jsonl')
+# 複数の投稿先へ同時に投稿する数
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '4'))
+
+def parse_destinations(channel_id):
+    """
+    投稿先（カンマ区切りの文字列またはリスト）をチャンネルID・ユーザーIDのリストにする
+    """
+    if isinstance(channel_id, str):
+        channel_id = channel_id.split(',')
+    # 同じ投稿先が重複していても1回だけ投稿する
+    return list(dict.fromkeys(destination.strip() for destination in channel_id if destination and destination.strip()))
+
+def post_report(client, channel_id, report_content, report_key=None):
+    """
+    レポートの本文を投稿する（clientは作成済みのWebClientを使い回す）
+    
+    channel_idはカンマ区切りで複数指定でき、ユーザーIDを指定するとDMで送る。
+    長いレポートはBlock Kitのセクションに分けて複数のメッセージで投稿する。
+    report_keyが同じレポートは、投稿済みのメッセージを再投稿しない（省略時は本文から作る）。
+    """
+    # slack_sdkの読み込みは時間がかかるため、投稿する直前に読み込む
+    from report_delivery import ReportDelivery
+    
+    destinations = parse_destinations(channel_id)
+    delivery = ReportDelivery(client, log_path=DELIVERY_LOG_PATH, workers=DELIVERY_WORKERS)
+    results = delivery.deliver(report_content, destinations, report_key)
+    
+    success = True
+    for destination in destinations:
+        result = results[destination]
+        if result['error']:
+            print(f"チャンネル投稿失敗: {destination}（{result['posted']}件投稿済み）: {result['error']}")
+            success = False
+        elif result['posted']:
+            print(f"チャンネル投稿成功: {destination}（{result['posted']}件）")
+        else:
+            print(f"投稿済みのため省略: {destination}")
+    return success
+
+def send_report_to_channel(report_path='weekly_report.txt', channel_id=None):
     """
     Slack Analyticsの結果を自動化チェックチャンネルに投稿する
     """
     # 環境変数から設定を取得
     slack_token = os.getenv('SLACK_BOT_TOKEN')
-    channel_id = os.getenv('SLACK_REPORT_CHANNEL_ID')
+    channel_id = channel_id or os.getenv('SLACK_REPORT_CHANNEL_ID')
     
     if not slack_token or not channel_id:
         print("エラー: SLACK_BOT_TOKEN または SLACK_REPORT_CHANNEL_ID が設定されていません")
         return False
     
-    client = WebClient(token=slack_token)
-    
+    # レポートファイルを読み込み
     try:
-        # レポートファイルを読み込み
-        try:
-            with open('weekly_report.txt', 'r', encoding='utf-8') as f:
-                report_content = f.read()
-        except FileNotFoundError:
-            print("エラー: weekly_report.txt が見つかりません")
-            return False
-        
-        # チャンネルに投稿
-        response = client.chat_postMessage(
-            channel=channel_id,
-            text=report_content
-        )
-        
-        if response['ok']:
-            print(f"チャンネル投稿成功: {channel_id}")
-            return True
-        else:
-            print(f"チャンネル投稿失敗: {response}")
-            return False
-            
-    except Exception as e:
-        print(f"チャンネル投稿エラー: {e}")
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report_content = f.read()
+    except FileNotFoundError:
+        print(f"エラー: {report_path} が見つかりません")
         return False
+    
+    # slack_sdkの読み込みは時間がかかるため、投稿する直前に読み込む
+    from slack_sdk.web import WebClient
+    from slack_rate_limit import RateLimitedClient
+    client = RateLimitedClient(WebClient(token=slack_token))
+    
+    return post_report(client, channel_id, report_content)
 
 if __name__ == "__main__":
     send_report_to_channel()
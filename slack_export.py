@@ -0,0 +1,119 @@
+import json
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from channel_activity import is_thread_reply
+
+
+# エクスポートに含まれるチャンネル一覧（channels.json: パブリック、groups.json: プライベート）
+CHANNEL_LISTS = (('channels.json', False), ('groups.json', True))
+USERS_FILE = 'users.json'
+
+# 集計に使わない項目（ワーカーから受け渡すデータを小さくするため読み込み時に捨てる）
+DROPPED_FIELDS = ('blocks', 'attachments', 'files', 'user_profile', 'bot_profile', 'replies', 'reply_users')
+
+# 日別ファイルの日付はタイムゾーンが決まっていないため、期間の前後1日まで読んでtsで絞り込む
+DAY_MARGIN = timedelta(days=1)
+
+
+def load_day_files(zip_path, names, start_ts, end_ts, include_replies):
+    """日別ファイルを読み込み、期間内のメッセージを (フォルダ名, 投稿, スレッド返信) のリストで返す
+
+    プロセスプールのワーカーで実行する（ZIPはワーカーごとに開き直す）。
+    """
+    results = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for name in names:
+            try:
+                with archive.open(name) as f:
+                    messages = json.load(f)
+            except (KeyError, ValueError) as e:
+                print(f"エクスポートの読み込みエラー（{name}）: {e}")
+                continue
+            posts = []
+            replies = []
+            for message in messages:
+                if 'ts' not in message or not start_ts < float(message['ts']) <= end_ts:
+                    continue
+                for field in DROPPED_FIELDS:
+                    message.pop(field, None)
+                # 「チャンネルにも投稿」された返信はAPIの履歴にも含まれるため投稿として扱う
+                if not is_thread_reply(message) or message.get('subtype') == 'thread_broadcast':
+                    posts.append(message)
+                elif include_replies:
+                    replies.append(message)
+            if posts or replies:
+                results.append((posixpath.dirname(name), posts, replies))
+    return results
+
+
+class SlackExport:
+    """Slackのエクスポート（ZIP）を展開せずに読み込む
+
+    チャンネルごとのフォルダに1日1ファイルのJSONが入っている標準の形式に対応する。
+    日別ファイルをプロセスプールのワーカーに分けて読み込み、APIから取得したときと
+    同じ形のページ（メッセージのリスト）として返す。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path) as archive:
+            names = set(archive.namelist())
+            self.channels = []
+            for list_name, is_private in CHANNEL_LISTS:
+                if list_name in names:
+                    for channel in json.loads(archive.read(list_name)):
+                        self.channels.append({**channel, 'is_private': is_private})
+            self.members = json.loads(archive.read(USERS_FILE)) if USERS_FILE in names else []
+        # フォルダ名（チャンネル名） → 日別ファイルのパス
+        self.day_files = {}
+        for name in sorted(names):
+            folder, filename = posixpath.split(name)
+            if folder and '/' not in folder and filename.endswith('.json'):
+                self.day_files.setdefault(folder, []).append(name)
+
+    def list_channels(self, include_archived=False):
+        """エクスポートに含まれるチャンネル一覧（APIと同じくアーカイブ済みは除く）"""
+        return [
+            channel for channel in self.channels
+            if include_archived or not channel.get('is_archived', False)
+        ]
+
+    def files_in_period(self, channels, start_time, end_time):
+        """期間に含まれる日別ファイルのパスを返す（チャンネルは指定したもののみ）"""
+        first_day = (start_time - DAY_MARGIN).strftime('%Y-%m-%d')
+        last_day = (end_time + DAY_MARGIN).strftime('%Y-%m-%d')
+        files = []
+        for channel in channels:
+            for name in self.day_files.get(channel['name'], []):
+                day = posixpath.basename(name)[:-len('.json')]
+                if first_day <= day <= last_day:
+                    files.append(name)
+        return files
+
+    def iter_pages(self, channels, start_time, end_time, workers=None, include_replies=False):
+        """期間内のメッセージを (チャンネル, 投稿, スレッド返信) の形で日別ファイルごとに返す
+
+        日別ファイルをworkers個のプロセスに分けて読み込む（返す順番は読み込み終わった順）。
+        """
+        channels_by_name = {channel['name']: channel for channel in channels}
+        files = self.files_in_period(channels, start_time, end_time)
+        if not files:
+            return
+        workers = max(1, workers or os.cpu_count() or 1)
+        # ワーカー間の負荷が偏らないよう、ワーカー数の4倍程度に分ける
+        chunk_size = max(1, -(-len(files) // (workers * 4)))
+        chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+        start_ts = start_time.timestamp()
+        end_ts = end_time.timestamp()
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            futures = [
+                executor.submit(load_day_files, self.path, chunk, start_ts, end_ts, include_replies)
+                for chunk in chunks
+            ]
+            for future in as_completed(futures):
+                for folder, posts, replies in future.result():
+                    yield channels_by_name[folder], posts, replies
@@ -0,0 +1,208 @@
+import random
+import threading
+import time
+
+from slack_sdk.errors import SlackApiError
+
+
+# Slack Web APIのレート制限ティア（1分あたりのリクエスト数の目安）
+# https://api.slack.com/docs/rate-limits
+TIER_LIMITS = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# 本リポジトリで使用するメソッドのティア
+METHOD_TIERS = {
+    'conversations.list': 2,
+    'conversations.history': 3,
+    'conversations.replies': 3,
+    'conversations.info': 3,
+    'conversations.open': 3,
+    'users.list': 2,
+    'users.info': 4,
+    'auth.test': 4,
+    # chat.postMessageは「1チャンネルあたり1秒に1回程度」の特別枠
+    'chat.postMessage': 4,
+}
+DEFAULT_TIER = 3
+
+# 429が返ってきたときの最大リトライ回数
+MAX_RATE_LIMIT_RETRIES = 5
+
+# 一時的なエラー（接続エラー・タイムアウト・5xx）の最大リトライ回数と、
+# 指数バックオフの初回待機時間・上限（秒）。実際の待機時間は0～上限のランダム（ジッター）
+MAX_TRANSIENT_RETRIES = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# 再試行して良いSlackのエラー（HTTPステータスは200でもサーバー側の一時的な問題を表す）
+TRANSIENT_ERRORS = ('internal_error', 'fatal_error', 'service_unavailable', 'request_timeout')
+# 再試行しても読めないチャンネルのエラー（botが参加していない・削除された・アーカイブされた）
+CHANNEL_ACCESS_ERRORS = ('not_in_channel', 'channel_not_found', 'is_archived')
+
+
+def api_method_name(attr_name):
+    """WebClientのメソッド名をAPIメソッド名に変換（conversations_history → conversations.history）"""
+    return attr_name.replace('_', '.', 1)
+
+
+def is_transient_error(error):
+    """再試行すれば成功する可能性のあるエラーか（接続エラー・タイムアウト・5xx・一時的なSlackエラー）"""
+    if isinstance(error, SlackApiError):
+        response = error.response
+        if response is None:
+            return False
+        if response.status_code >= 500:
+            return True
+        data = response.data if isinstance(response.data, dict) else {}
+        return data.get('error') in TRANSIENT_ERRORS
+    # urllib.error.URLError・socket.timeout・ConnectionErrorはいずれもOSError
+    return isinstance(error, OSError)
+
+
+def is_channel_access_error(error):
+    """そのチャンネルを読む権限がないなど、再試行しても成功しないチャンネルのエラーか"""
+    if not isinstance(error, SlackApiError) or error.response is None:
+        return False
+    data = error.response.data if isinstance(error.response.data, dict) else {}
+    return data.get('error') in CHANNEL_ACCESS_ERRORS
+
+
+def backoff_seconds(attempt, base=BACKOFF_BASE_SECONDS, maximum=BACKOFF_MAX_SECONDS):
+    """attempt回目（0始まり）の再試行までの待機時間（指数バックオフ＋フルジッター）"""
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（スレッドセーフ）"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, per_minute // 10)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def pause(self, seconds):
+        """Retry-Afterを受け取ったら、このバケットを使う全スレッドを一時停止する"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def acquire(self):
+        """トークンを1つ取得できるまで待機し、待機した秒数を返す"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class RateLimiter:
+    """APIメソッドごとのトークンバケットを管理する"""
+
+    def __init__(self, tier_limits=None, method_tiers=None, telemetry=None):
+        self.tier_limits = tier_limits or TIER_LIMITS
+        self.method_tiers = method_tiers or METHOD_TIERS
+        # 呼び出し回数・レイテンシ・待機時間の記録先（telemetry.Telemetry、Noneなら記録しない）
+        self.telemetry = telemetry
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, method):
+        with self.lock:
+            if method not in self.buckets:
+                tier = self.method_tiers.get(method, DEFAULT_TIER)
+                self.buckets[method] = TokenBucket(self.tier_limits[tier])
+            return self.buckets[method]
+
+    def call(self, method, func, **kwargs):
+        """レート制限に従ってAPIを呼び出す
+
+        429の場合はRetry-Afterだけ待って、接続エラーや5xxなど一時的なエラーの場合は
+        指数バックオフ（ジッター付き）で待って再試行する。
+        """
+        bucket = self.bucket(method)
+        rate_limited = 0
+        transient = 0
+        while True:
+            waited = bucket.acquire()
+            started = time.perf_counter()
+            try:
+                response = func(**kwargs)
+            except Exception as e:
+                if self.telemetry:
+                    self.telemetry.record_throttle(method, waited)
+                    self.telemetry.record_call(method, time.perf_counter() - started, ok=False)
+                response = getattr(e, 'response', None)
+                if isinstance(e, SlackApiError) and response is not None and response.status_code == 429:
+                    if rate_limited >= MAX_RATE_LIMIT_RETRIES:
+                        raise
+                    retry_after = get_retry_after(response)
+                    if self.telemetry:
+                        self.telemetry.record_rate_limited(method, retry_after)
+                    rate_limited += 1
+                    print(f"レート制限（{method}）: {retry_after}秒待機して再試行します（{rate_limited}/{MAX_RATE_LIMIT_RETRIES}）")
+                    bucket.pause(retry_after)
+                    continue
+                if not is_transient_error(e) or transient >= MAX_TRANSIENT_RETRIES:
+                    raise
+                delay = backoff_seconds(transient)
+                if self.telemetry:
+                    self.telemetry.record_retry(method, delay)
+                transient += 1
+                print(f"一時的なエラー（{method}）: {e} → {delay:.1f}秒待機して再試行します（{transient}/{MAX_TRANSIENT_RETRIES}）")
+                time.sleep(delay)
+                continue
+            if self.telemetry:
+                self.telemetry.record_throttle(method, waited)
+                self.telemetry.record_call(method, time.perf_counter() - started)
+            return response
+
+
+def get_retry_after(response, default=1.0):
+    """レスポンスヘッダーからRetry-After（秒）を取得"""
+    headers = response.headers or {}
+    value = headers.get('Retry-After', headers.get('retry-after'))
+    if isinstance(value, list):
+        value = value[0] if value else None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimitedClient:
+    """WebClientをラップし、全てのAPI呼び出しをRateLimiter経由にする"""
+
+    def __init__(self, client, rate_limiter=None):
+        self.client = client
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+        method = api_method_name(name)
+
+        def call(**kwargs):
+            return self.rate_limiter.call(method, attr, **kwargs)
+        return call
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+# APIレイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Telemetry:
+    """API呼び出しと処理ステージの計測結果を集める（スレッドセーフ）"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.methods = {}
+        self.stages = {}
+
+    def _method(self, method):
+        if method not in self.methods:
+            self.methods[method] = {
+                'calls': 0,
+                'errors': 0,
+                'retries': 0,
+                'rate_limited': 0,
+                'rate_limit_wait_seconds': 0.0,
+                'backoff_wait_seconds': 0.0,
+                'throttle_wait_seconds': 0.0,
+                'latency_seconds_sum': 0.0,
+                'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        return self.methods[method]
+
+    def record_call(self, method, latency, ok=True):
+        """API呼び出し1回の結果とレイテンシを記録"""
+        with self.lock:
+            stats = self._method(method)
+            stats['calls'] += 1
+            if not ok:
+                stats['errors'] += 1
+            stats['latency_seconds_sum'] += latency
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats['latency_buckets'][i] += 1
+                    break
+            else:
+                stats['latency_buckets'][-1] += 1
+
+    def record_throttle(self, method, seconds):
+        """レートリミッターでトークン待ちをした時間を記録"""
+        if seconds <= 0:
+            return
+        with self.lock:
+            self._method(method)['throttle_wait_seconds'] += seconds
+
+    def record_rate_limited(self, method, retry_after):
+        """429を受け取り、Retry-Afterだけ待って再試行したことを記録"""
+        with self.lock:
+            stats = self._method(method)
+            stats['rate_limited'] += 1
+            stats['retries'] += 1
+            stats['rate_limit_wait_seconds'] += retry_after
+
+    def record_retry(self, method, delay):
+        """一時的なエラーのため、バックオフして再試行したことを記録"""
+        with self.lock:
+            stats = self._method(method)
+            stats['retries'] += 1
+            stats['backoff_wait_seconds'] += delay
+
+    @contextmanager
+    def stage(self, name):
+        """with telemetry.stage('history_fetch'): のように処理ステージの時間を計測"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stats = self.stages.setdefault(name, {'seconds': 0.0, 'count': 0})
+                stats['seconds'] += elapsed
+                stats['count'] += 1
+
+    def summary(self):
+        """計測結果を辞書で返す"""
+        with self.lock:
+            methods = {}
+            for method, stats in sorted(self.methods.items()):
+                methods[method] = dict(stats)
+                methods[method]['latency_buckets'] = {
+                    **{str(bound): count for bound, count in zip(LATENCY_BUCKETS, stats['latency_buckets'])},
+                    '+Inf': stats['latency_buckets'][-1],
+                }
+            return {
+                'started_at': self.started_at,
+                'elapsed_seconds': time.time() - self.started_at,
+                'api_calls_total': sum(stats['calls'] for stats in self.methods.values()),
+                'methods': methods,
+                'stages': {name: dict(stats) for name, stats in self.stages.items()},
+            }
+
+    def to_prometheus(self):
+        """計測結果をPrometheusのテキスト形式で返す"""
+        summary = self.summary()
+        lines = [
+            '# HELP slack_analytics_api_calls_total Slack API calls by method',
+            '# TYPE slack_analytics_api_calls_total counter',
+        ]
+        for method, stats in summary['methods'].items():
+            lines.append(f'slack_analytics_api_calls_total{{method="{method}"}} {stats["calls"]}')
+        for key, name in [
+            ('errors', 'api_errors_total'),
+            ('retries', 'api_retries_total'),
+            ('rate_limited', 'api_rate_limited_total'),
+            ('rate_limit_wait_seconds', 'api_rate_limit_wait_seconds_total'),
+            ('backoff_wait_seconds', 'api_backoff_wait_seconds_total'),
+            ('throttle_wait_seconds', 'api_throttle_wait_seconds_total'),
+        ]:
+            lines.append(f'# TYPE slack_analytics_{name} counter')
+            for method, stats in summary['methods'].items():
+                lines.append(f'slack_analytics_{name}{{method="{method}"}} {stats[key]}')
+
+        lines.append('# TYPE slack_analytics_api_latency_seconds histogram')
+        for method, stats in summary['methods'].items():
+            cumulative = 0
+            for bound, count in stats['latency_buckets'].items():
+                cumulative += count
+                lines.append(f'slack_analytics_api_latency_seconds_bucket{{method="{method}",le="{bound}"}} {cumulative}')
+            lines.append(f'slack_analytics_api_latency_seconds_sum{{method="{method}"}} {stats["latency_seconds_sum"]}')
+            lines.append(f'slack_analytics_api_latency_seconds_count{{method="{method}"}} {stats["calls"]}')
+
+        lines.append('# TYPE slack_analytics_stage_seconds gauge')
+        for name, stats in summary['stages'].items():
+            lines.append(f'slack_analytics_stage_seconds{{stage="{name}"}} {stats["seconds"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path, format='json'):
+        """計測結果をファイルに書き出す（format: json / prometheus）"""
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                if format == 'prometheus':
+                    f.write(self.to_prometheus())
+                else:
+                    json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"計測結果の保存エラー: {e}")
@@ -0,0 +1,202 @@
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import defaultdict
+
+from activity_aggregator import EXCLUDED_SUBTYPES
+from rollups import jst_day
+
+
+# Slackの書式（メンション・チャンネル・リンク・絵文字・コード）は単語として数えない
+SLACK_MARKUP = re.compile(r'```.*?```|`[^`]*`|<[^>]*>|:[a-z0-9_+\-]+:', re.S)
+# 英数字の単語（gpt-4o・veo3・dall-eのような記号入りの名前も1語）、カタカナ・漢字の2文字以上の並び
+TOKEN = re.compile(r'[a-z][a-z0-9]*(?:[.\-+][a-z0-9]+)*|[ァ-ヶー]{2,}|[一-龯々]{2,}')
+
+# カタカナ表記のツール名は英語表記にそろえる（NFKC・小文字にした後の表記）
+KATAKANA_ALIASES = {
+    'チャットgpt': 'chatgpt',
+    'クロード': 'claude',
+    'ジェミニ': 'gemini',
+    'ジェミナイ': 'gemini',
+    'ノートブックlm': 'notebooklm',
+    'マナス': 'manus',
+    'ジェンスパーク': 'genspark',
+    'ミッドジャーニー': 'midjourney',
+    'ディファイ': 'dify',
+    'ザピアー': 'zapier',
+    'コパイロット': 'copilot',
+    'パープレキシティ': 'perplexity',
+}
+
+# ツールの言及として数える単語と、レポートでの表記
+TOOLS = {
+    'chatgpt': 'ChatGPT',
+    'claude': 'Claude',
+    'gemini': 'Gemini',
+    'notebooklm': 'NotebookLM',
+    'manus': 'Manus',
+    'genspark': 'Genspark',
+    'suno': 'Suno',
+    'udio': 'Udio',
+    'veo3': 'Veo3',
+    'midjourney': 'Midjourney',
+    'sora': 'Sora',
+    'n8n': 'n8n',
+    'dify': 'Dify',
+    'zapier': 'Zapier',
+    'cursor': 'Cursor',
+    'copilot': 'Copilot',
+    'perplexity': 'Perplexity',
+    'dall-e': 'DALL-E',
+}
+
+# キーワードとして数えない英単語
+STOPWORDS = frozenset("""
+    a an and are as at be but by can do for from have i if in is it me my no not of on or so that the this
+    to was we what when with you your
+""".split())
+
+
+def tokenize(text):
+    """メッセージ本文を単語のリストにする（日本語は形態素解析をせず、カタカナ・漢字の並びを1語とする）"""
+    text = unicodedata.normalize('NFKC', text).lower()
+    text = SLACK_MARKUP.sub(' ', text)
+    for alias, name in KATAKANA_ALIASES.items():
+        text = text.replace(alias, f' {name} ')
+    return [token for token in TOKEN.findall(text) if len(token) > 1 and token not in STOPWORDS]
+
+
+class TermIndexBuilder:
+    """指定チャンネルのメッセージ本文を日別・チャンネル別の単語の出現数にまとめる
+
+    ActivityAggregatorと同じadd()で受け取るため、同じ走査の中で一緒に更新できる。
+    単語ごとに出現回数と、その単語を含むメッセージ数を数える（botの投稿は数えない）。
+    """
+
+    def __init__(self, is_bot_user, channel_ids):
+        self.is_bot_user = is_bot_user
+        self.channel_ids = frozenset(channel_ids)
+        self.counts = defaultdict(lambda: [0, 0])
+        self.lock = threading.Lock()
+
+    def add(self, messages, channel_id=None, is_reply=False):
+        if channel_id not in self.channel_ids:
+            return
+        # 本文の分解とbot判定はロックの外で行う
+        tokenized = [
+            (jst_day(message['ts']), tokenize(message['text'])) for message in messages
+            if message.get('text') and message.get('subtype') not in EXCLUDED_SUBTYPES
+            and message.get('user') and not self.is_bot_user(message['user'])
+        ]
+        with self.lock:
+            for day, tokens in tokenized:
+                for token in tokens:
+                    self.counts[(day, channel_id, token)][0] += 1
+                for token in set(tokens):
+                    self.counts[(day, channel_id, token)][1] += 1
+
+    def discard(self, channel_ids):
+        """指定したチャンネルの集計を捨てる（取得が完了しなかったチャンネルを保存しないため）"""
+        channel_ids = set(channel_ids)
+        if not channel_ids:
+            return
+        with self.lock:
+            for key in [key for key in self.counts if key[1] in channel_ids]:
+                del self.counts[key]
+
+
+class TermIndex:
+    """単語 → 日別・チャンネル別の出現数の転置インデックスをSQLiteに保存する
+
+    取得したメッセージの日だけを追加・置き換えるため、過去の期間のメッセージを再取得せずに
+    任意の期間の単語の出現数を合算できる。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS term_days (
+                    term TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    channel_id TEXT NOT NULL,
+                    occurrences INTEGER NOT NULL,
+                    messages INTEGER NOT NULL,
+                    PRIMARY KEY (term, day, channel_id)
+                ) WITHOUT ROWID
+            """)
+            # 期間で合算するための索引
+            self.conn.execute("CREATE INDEX IF NOT EXISTS term_days_by_day ON term_days (day, term)")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def save(self, builder, first_day, last_day):
+        """first_day ～ last_day の日付の出現数を置き換える（途中から始まる日・途中で終わる日は保存しない）"""
+        rows = [
+            (term, day, channel_id, occurrences, messages)
+            for (day, channel_id, term), (occurrences, messages) in builder.counts.items()
+            if first_day <= day <= last_day
+        ]
+        days = sorted({row[1] for row in rows})
+        channel_ids = sorted({row[2] for row in rows})
+        with self.lock, self.conn:
+            # 取得し直した日・チャンネルの古い出現数を削除してから書き込む
+            for day in days:
+                self.conn.executemany(
+                    "DELETE FROM term_days WHERE day = ? AND channel_id = ?",
+                    [(day, channel_id) for channel_id in channel_ids]
+                )
+            self.conn.executemany(
+                "INSERT INTO term_days (term, day, channel_id, occurrences, messages) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(days)
+
+    def has_days(self, first_day, last_day):
+        """first_day ～ last_day に保存済みの日があるか"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM term_days WHERE day BETWEEN ? AND ? LIMIT 1", (first_day, last_day)
+            ).fetchone()
+        return row is not None
+
+    def term_counts(self, first_day, last_day, channel_ids=None):
+        """first_day ～ last_day の単語ごとの、その単語を含むメッセージ数を返す"""
+        sql = "SELECT term, SUM(messages) FROM term_days WHERE day BETWEEN ? AND ?"
+        params = [first_day, last_day]
+        if channel_ids is not None:
+            channel_ids = list(channel_ids)
+            sql += f" AND channel_id IN ({', '.join('?' for _ in channel_ids)})"
+            params += channel_ids
+        with self.lock:
+            return dict(self.conn.execute(f"{sql} GROUP BY term", params).fetchall())
+
+    def trending(self, current_days, previous_days, n, min_count=3, channel_ids=None):
+        """前期間より多く話題になった単語を (単語, 今期間の件数, 前期間の件数) のリストで返す
+
+        ツール名は除き、今期間にmin_count件以上のメッセージに出てきた単語を増えた件数の多い順に並べる。
+        """
+        current = self.term_counts(*current_days, channel_ids)
+        previous = self.term_counts(*previous_days, channel_ids)
+        candidates = [
+            (term, count, previous.get(term, 0)) for term, count in current.items()
+            if count >= min_count and count > previous.get(term, 0) and term not in TOOLS
+        ]
+        candidates.sort(key=lambda item: (-(item[1] - item[2]), -item[1], item[0]))
+        return candidates[:n]
+
+    def tool_mentions(self, current_days, previous_days, channel_ids=None):
+        """ツールごとの言及数を (表記, 今期間の件数, 前期間の件数) のリストで返す（今期間の多い順）"""
+        current = self.term_counts(*current_days, channel_ids)
+        previous = self.term_counts(*previous_days, channel_ids)
+        mentions = [
+            (name, current.get(term, 0), previous.get(term, 0)) for term, name in TOOLS.items()
+            if current.get(term) or previous.get(term)
+        ]
+        mentions.sort(key=lambda item: (-item[1], item[0]))
+        return mentions
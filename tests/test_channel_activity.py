@@ -0,0 +1,72 @@
+from channel_activity import ChannelActivity, analyze_channels, empty_channel_activity, reduce_channel_activity
+
+
+BOT_IDS = {'UBOT'}
+CHANNELS = [{'id': 'C1', 'name': 'general'}, {'id': 'C2', 'name': 'random'}]
+
+# チャンネル履歴（conversations_historyが返すメッセージ）
+HISTORY = [
+    # 人とbotが1件ずつ返信したスレッド（reply_countはbotの返信も含む）
+    {'ts': '100.0', 'thread_ts': '100.0', 'reply_count': 2, 'user': 'UA',
+     'reactions': [{'name': 'eyes', 'count': 2, 'users': ['UB', 'UC']}]},
+    {'ts': '101.0', 'user': 'UB'},
+    {'ts': '102.0', 'user': 'UBOT'},
+    {'ts': '103.0', 'subtype': 'bot_message', 'bot_id': 'B1', 'reactions': [{'name': 'ok', 'count': 1, 'users': ['UA']}]},
+    {'ts': '104.0', 'subtype': 'system', 'user': 'UC'},
+    # 「チャンネルにも投稿」された返信
+    {'ts': '105.5', 'thread_ts': '100.0', 'subtype': 'thread_broadcast', 'user': 'UC'},
+]
+# スレッドの返信（conversations_repliesから取得。親メッセージとチャンネルにも投稿された返信は除く）
+REPLIES = [
+    {'ts': '105.0', 'thread_ts': '100.0', 'user': 'UC'},
+    {'ts': '106.0', 'thread_ts': '100.0', 'user': 'UBOT'},
+]
+
+
+def test_counts_reply_count_when_replies_are_not_fetched():
+    stats = analyze_channels({'C1': HISTORY}, CHANNELS, BOT_IDS)
+
+    assert stats['general'] == {
+        'posts': 2,
+        'replies': 2,
+        'threads': 1,
+        'unique_posters': 3,
+        'reactions': 3,
+        'total_activity': 4,
+    }
+    assert stats['random']['total_activity'] == 0
+
+
+def test_counts_fetched_human_replies():
+    stats = analyze_channels({'C1': HISTORY + REPLIES}, CHANNELS, BOT_IDS, fetched_replies=True)
+
+    # 返信はbotを除いた2件（スレッドの返信と、チャンネルにも投稿された返信）
+    assert stats['general']['posts'] == 2
+    assert stats['general']['replies'] == 2
+    assert stats['general']['threads'] == 1
+    assert stats['general']['unique_posters'] == 3
+
+
+def test_channel_activity_matches_reducer_and_merges():
+    activity = ChannelActivity(BOT_IDS, ['C1'], fetched_replies=True)
+    activity.add(HISTORY[:3], 'C1')
+    activity.add(HISTORY[3:], 'C1')
+    activity.add(REPLIES, 'C1', is_reply=True)
+    activity.add(HISTORY, 'C9')
+
+    expected = analyze_channels({'C1': HISTORY + REPLIES}, CHANNELS[:1], BOT_IDS, fetched_replies=True)
+    assert activity.channel_stats(CHANNELS[:1]) == expected
+
+    merged = ChannelActivity(BOT_IDS, ['C1'], fetched_replies=True)
+    merged.merge_state(activity.to_state())
+    merged.merge_state(activity.to_state())
+    stats = merged.channel_stats(CHANNELS[:1])['general']
+    assert stats['posts'] == 4
+    assert stats['replies'] == 4
+    assert stats['unique_posters'] == 3
+
+
+def test_reduce_with_hyperloglog_posters():
+    activity = reduce_channel_activity(empty_channel_activity(precision=10), HISTORY, BOT_IDS)
+
+    assert len(activity['posters']) == 3
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+
+# キャッシュの有効期限（秒）。デフォルトは1日
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class UserDirectory:
+    """Slackユーザー情報のキャッシュ（users_listで一括取得し、メモリ／ファイルに保持）"""
+
+    def __init__(self, client, cache_path=None, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.client = client
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self._users = {}
+        self._loaded_at = 0.0
+        self._prefetched = False
+        # Trueなら一覧にないユーザーをusers_infoで問い合わせない（エクスポートから読み込んだとき）
+        self._offline = False
+        self._lock = threading.Lock()
+
+    def _is_expired(self):
+        return time.time() - self._loaded_at > self.ttl_seconds
+
+    def _load_from_disk(self):
+        """キャッシュファイルが有効期限内であれば読み込む"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ユーザーキャッシュ読み込みエラー: {e}")
+            return False
+
+        loaded_at = data.get('loaded_at', 0)
+        if time.time() - loaded_at > self.ttl_seconds:
+            return False
+
+        self._users = data.get('users', {})
+        self._loaded_at = loaded_at
+        return True
+
+    def _save_to_disk(self):
+        if not self.cache_path:
+            return
+        try:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'loaded_at': self._loaded_at, 'users': self._users}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"ユーザーキャッシュ保存エラー: {e}")
+
+    def prefetch(self):
+        """users_listで全ユーザーを一括取得してキャッシュする"""
+        # 複数スレッドから呼ばれても取得は1回だけ行う
+        with self._lock:
+            self._prefetch()
+
+    def _prefetch(self):
+        if self._offline or (self._prefetched and not self._is_expired()):
+            return
+        self._prefetched = True
+        if self._load_from_disk():
+            print(f"ユーザーキャッシュを使用: {len(self._users)}人")
+            return
+
+        users = {}
+        cursor = None
+        complete = False
+        try:
+            while True:
+                response = self.client.users_list(cursor=cursor, limit=1000)
+                if not response['ok']:
+                    print(f"ユーザー一覧取得エラー: {response}")
+                    break
+                for member in response['members']:
+                    users[member['id']] = member
+                cursor = response.get('response_metadata', {}).get('next_cursor')
+                if not cursor:
+                    complete = True
+                    break
+        except Exception as e:
+            print(f"ユーザー一覧取得エラー: {e}")
+
+        self._users.update(users)
+        self._loaded_at = time.time()
+        print(f"取得したユーザー数: {len(users)}")
+        # 途中で失敗した一覧はこの実行の中だけで使う（ファイルに保存すると、有効期限まで
+        # 一覧にないユーザーをusers_infoで1人ずつ問い合わせることになる）
+        if complete and users:
+            self._save_to_disk()
+        elif users:
+            print("ユーザー一覧を最後まで取得できなかったため、キャッシュファイルには保存しません")
+
+    def load_members(self, members):
+        """エクスポートのusers.jsonなど、取得済みのユーザー一覧を使う（APIは呼ばない）"""
+        with self._lock:
+            self._users = {member['id']: member for member in members}
+            self._loaded_at = time.time()
+            self._prefetched = True
+            self._offline = True
+        print(f"読み込んだユーザー数: {len(self._users)}")
+
+    def get(self, user_id):
+        """ユーザー情報を取得（キャッシュになければusers_infoで個別に取得）"""
+        if not self._prefetched or self._is_expired():
+            self.prefetch()
+
+        if user_id in self._users:
+            return self._users[user_id]
+        if self._offline:
+            return None
+
+        user_info = None
+        try:
+            response = self.client.users_info(user=user_id)
+            if response['ok']:
+                user_info = response['user']
+        except Exception as e:
+            print(f"ユーザー情報取得エラー: {e}")
+
+        # 取得に失敗した場合もNoneを記録し、同じユーザーへの再リクエストを防ぐ
+        self._users[user_id] = user_info
+        return user_info
+
+    def members(self):
+        """キャッシュ済みの全ユーザー情報を返す（未取得ならusers_listで一括取得）"""
+        if not self._prefetched or self._is_expired():
+            self.prefetch()
+        return [user_info for user_info in self._users.values() if user_info]
+
+    @staticmethod
+    def _is_bot_info(user_info):
+        return user_info.get('is_bot', False) or user_info.get('name', '').startswith('bot')
+
+    def is_bot(self, user_id):
+        """ユーザーがbotかどうかを判定"""
+        user_info = self.get(user_id)
+        if not user_info:
+            return False
+        return self._is_bot_info(user_info)
+
+    def bot_ids(self):
+        """botのユーザーIDの集合（集計中にユーザーごとの問い合わせをしないよう、先にまとめて求める）"""
+        return {user_info['id'] for user_info in self.members() if self._is_bot_info(user_info)}
+
+    def get_name(self, user_id):
+        """ユーザーIDからユーザー名を取得"""
+        user_info = self.get(user_id)
+        if not user_info:
+            return user_id
+        profile = user_info.get('profile', {})
+        return (user_info.get('real_name') or profile.get('display_name')
+                or user_info.get('display_name') or user_info.get('name') or user_id)
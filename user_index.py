@@ -0,0 +1,172 @@
+import bisect
+import difflib
+import json
+import os
+import re
+import time
+import unicodedata
+
+
+# インデックスの有効期限（秒）。デフォルトは1日
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+# 検索対象にする項目
+SEARCH_FIELDS = ('real_name', 'display_name', 'name')
+
+# あいまい検索で候補にする類似度の下限（0～1）
+FUZZY_CUTOFF = 0.6
+
+# カタカナ（ァ～ヶ）→ひらがなの変換表
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+# 名前を単語に分ける区切り（空白・記号）
+WORD_SEPARATOR = re.compile(r'[\s\-_.,・()（）\[\]【】|｜/／@]+')
+
+
+def normalize(text):
+    """検索用に文字列を正規化する（全角・半角、カタカナ・ひらがな、大文字・小文字を区別しない）"""
+    # NFKCで全角英数字→半角、半角カナ→全角カナにそろえる
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    # カタカナをひらがなにそろえる
+    return text.translate(KATAKANA_TO_HIRAGANA).strip()
+
+
+def user_fields(member):
+    """users_listのメンバー情報から検索対象の項目を取り出す"""
+    profile = member.get('profile', {})
+    return {
+        'real_name': member.get('real_name') or profile.get('real_name', ''),
+        'display_name': profile.get('display_name') or member.get('display_name', ''),
+        'name': member.get('name', ''),
+    }
+
+
+class UserIndex:
+    """ユーザー検索用のインデックス（前方一致・部分一致・あいまい検索）
+
+    正規化した名前とその単語を並べ替えて保持し、前方一致は二分探索で求める。
+    ファイルには検索に必要な項目だけを保存するため、大きなワークスペースでも
+    2回目以降はAPIを呼ばずにすぐ検索できる。
+    """
+
+    def __init__(self, users, loaded_at=None, normalized=None):
+        # ユーザーID → {'id', 'real_name', 'display_name', 'name', 'is_bot', 'deleted'}
+        self.users = {user['id']: user for user in users}
+        self.loaded_at = loaded_at or time.time()
+        # (正規化した名前・単語, ユーザーID) を並べ替えたもの
+        self.terms = []
+        # ユーザーID → 正規化した項目（部分一致・あいまい検索用。保存済みのものがあれば再利用）
+        self.normalized = {}
+        normalized = normalized or {}
+        for user in users:
+            values = normalized.get(user['id'])
+            if values is None:
+                values = [normalize(user[field]) for field in SEARCH_FIELDS if user.get(field)]
+            self.normalized[user['id']] = values
+            keys = set(values)
+            for value in values:
+                keys.update(word for word in WORD_SEPARATOR.split(value) if word)
+            self.terms.extend((key, user['id']) for key in keys)
+        self.terms.sort()
+        self._keys = [key for key, _ in self.terms]
+
+    @classmethod
+    def from_members(cls, members):
+        """users_listのメンバー情報からインデックスを作成"""
+        users = [
+            {
+                'id': member['id'],
+                **user_fields(member),
+                'is_bot': member.get('is_bot', False),
+                'deleted': member.get('deleted', False),
+            }
+            for member in members
+        ]
+        return cls(users)
+
+    @classmethod
+    def load(cls, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        """保存済みのインデックスを読み込む（なければ・有効期限切れならNone）"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"ユーザーインデックス読み込みエラー: {e}")
+            return None
+        if time.time() - data.get('loaded_at', 0) > ttl_seconds:
+            return None
+        return cls(data.get('users', []), data['loaded_at'], data.get('normalized'))
+
+    def save(self, path):
+        """インデックスをファイルに保存"""
+        if not path:
+            return
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'loaded_at': self.loaded_at,
+                    'users': list(self.users.values()),
+                    'normalized': self.normalized,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"ユーザーインデックス保存エラー: {e}")
+
+    def prefix(self, query):
+        """名前・単語がqueryで始まるユーザーIDを返す（完全一致を先に並べる）"""
+        query = normalize(query)
+        if not query:
+            return []
+        exact = []
+        matched = []
+        i = bisect.bisect_left(self._keys, query)
+        while i < len(self._keys) and self._keys[i].startswith(query):
+            key, user_id = self.terms[i]
+            (exact if key == query else matched).append(user_id)
+            i += 1
+        return list(dict.fromkeys(exact + matched))
+
+    def substring(self, query):
+        """名前のどこかにqueryを含むユーザーIDを返す"""
+        query = normalize(query)
+        if not query:
+            return []
+        return [user_id for user_id, values in self.normalized.items() if any(query in value for value in values)]
+
+    def fuzzy(self, query, limit=10, cutoff=FUZZY_CUTOFF):
+        """名前・単語がqueryに似ているユーザーIDを似ている順に返す"""
+        query = normalize(query)
+        if not query:
+            return []
+        keys = list(dict.fromkeys(self._keys))
+        matched = []
+        for key in difflib.get_close_matches(query, keys, n=limit, cutoff=cutoff):
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                matched.append(self.terms[i][1])
+                i += 1
+        return list(dict.fromkeys(matched))
+
+    def search(self, query, limit=20, fuzzy=False, include_deleted=False):
+        """前方一致 → 部分一致 →（fuzzy=Trueなら）あいまい検索の順に候補を集める
+
+        (ユーザー情報, 一致の種類) のリストを返す。一致の種類は prefix / substring / fuzzy。
+        """
+        results = {}
+        for match, user_ids in [
+            ('prefix', self.prefix(query)),
+            ('substring', self.substring(query)),
+            ('fuzzy', self.fuzzy(query, limit) if fuzzy else []),
+        ]:
+            for user_id in user_ids:
+                user = self.users[user_id]
+                if user.get('deleted') and not include_deleted:
+                    continue
+                results.setdefault(user_id, (user, match))
+        return list(results.values())[:limit]